@@ -0,0 +1,229 @@
+# bench.py
+"""
+Benchmark do pipeline de reconciliação sobre dados sintéticos (ver synth.py).
+
+Exemplo:
+    python bench.py --sizes 1000 100000 1000000 -o bench.json
+    python bench.py --sizes 1000 100000 1000000 -o novo.json --compare bench.json
+    python bench.py --sizes 1000 --startup --startup-budget 0.5
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from core import _aggregate_movements, _ensure_df, reconcile_aggregated, ENGINES
+from synth import generate_synthetic, verify_report
+
+logger = logging.getLogger("bench")
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000, 10_000_000]
+
+class _Stage:
+    """Mede tempo de parede e pico de memória (tracemalloc) de uma etapa."""
+
+    def __init__(self, results, name, memory=True):
+        self.results, self.name, self.memory = results, name, memory
+
+    def __enter__(self):
+        if self.memory:
+            tracemalloc.reset_peak()
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.t0
+        entry = {'seconds': round(seconds, 6)}
+        if self.memory:
+            entry['peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2**20, 3)
+        self.results[self.name] = entry
+        return False
+
+def shape_for(rows, days, density):
+    """Produtos necessários para ~`rows` linhas de entrada (compras + vendas + estoque)."""
+    por_produto = days * (1 + 2 * density)
+    return max(1, int(round(rows / por_produto)))
+
+def run_size(rows, engines, days=30, density=0.3, rate=0.01, tolerance=0, seed=0, memory=True, loop_max_rows=20_000):
+    products = shape_for(rows, days, density)
+    data = generate_synthetic(products, days, density, rate, rate, rate, seed=seed)
+    n_in = {'compras': len(data.compras), 'vendas': len(data.vendas), 'estoque': len(data.estoque)}
+
+    shared = {}
+    with _Stage(shared, 'normalize', memory):
+        compras = _ensure_df(data.compras, ['data','produto','quantidade_comprada'])
+        vendas = _ensure_df(data.vendas, ['data','produto','quantidade_vendida'])
+        estoque = _ensure_df(data.estoque, ['data','produto','quantidade_em_estoque'])
+    with _Stage(shared, 'aggregate', memory):
+        aggs = _aggregate_movements(compras, vendas, estoque)
+    del compras, vendas, estoque
+
+    results = []
+    for engine in engines:
+        if engine == 'loop' and sum(n_in.values()) > loop_max_rows:
+            logger.info(f"{rows}: motor 'loop' ignorado (acima de {loop_max_rows} linhas)")
+            continue
+        stages = dict(shared)
+        with _Stage(stages, 'reconcile', memory):
+            report = reconcile_aggregated(*aggs, tolerance=tolerance, engine=engine)
+        with _Stage(stages, 'verify', memory):
+            check = verify_report(report, data.expected)
+        results.append({
+            'size': rows, 'engine': engine, 'products': products, 'days': days,
+            'input_rows': n_in, 'report_rows': len(report),
+            'stages': stages, 'verification': check,
+        })
+        logger.info(f"{rows} [{engine}]: " + ", ".join(f"{k} {v['seconds']:.3f}s" for k, v in stages.items())
+                    + f" | {'ok' if check['ok'] else 'DIVERGENTE'}")
+    return results
+
+# Partida da interface: tempo até a janela aparecer (sem display, até importar main.py)
+STARTUP_BUDGET_S = 0.5
+# Módulos que não podem ser importados antes de a janela aparecer
+HEAVY_MODULES = ('numpy', 'pandas', 'pyarrow')
+
+_STARTUP_SCRIPT = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import main
+r = {'import_s': time.perf_counter() - t0, 'heavy_modules': sorted(m for m in %r if m in sys.modules)}
+try:
+    app = main.StockValidatorApp()
+except Exception as e:          # sem display (ex.: servidor de CI): mede só a importação
+    r['window_error'] = str(e)
+else:
+    while not app.winfo_ismapped() and time.perf_counter() - t0 < 60:
+        app.update()
+    r['window_s'] = time.perf_counter() - t0
+    # Pronto para uso quando o pandas/motor terminam de carregar em segundo plano
+    while app.report_df is None and time.perf_counter() - t0 < 120:
+        app.update(); time.sleep(0.005)
+    r['ready_s'] = time.perf_counter() - t0
+    app._on_close()
+print(json.dumps(r))
+"""
+
+def measure_startup(repeat=3):
+    """
+    Mede a partida de `main.py` em processos novos (o menor tempo de `repeat`).
+
+    `import_s`: importar main.py; `window_s`: até a janela aparecer e
+    `ready_s`: até o pandas/motor terminarem de carregar (só com display);
+    `heavy_modules`: módulos pesados já importados ao fim do import.
+    """
+    script = _STARTUP_SCRIPT % (HEAVY_MODULES,)
+    melhores = {}
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        saida = subprocess.run([sys.executable, '-c', script], cwd=os.path.dirname(os.path.abspath(__file__)),
+                               capture_output=True, text=True, check=True).stdout
+        r = json.loads(saida.strip().splitlines()[-1])
+        r['process_s'] = time.perf_counter() - t0
+        for k, v in r.items():
+            melhores[k] = min(melhores[k], v) if isinstance(v, float) and k in melhores else v
+    return {k: round(v, 4) if isinstance(v, float) else v for k, v in melhores.items()}
+
+def check_startup(startup, budget=STARTUP_BUDGET_S):
+    """Problemas da partida: módulos pesados importados cedo ou tempo acima de `budget`."""
+    problemas = []
+    if startup['heavy_modules']:
+        problemas.append(f"módulos pesados importados na partida: {', '.join(startup['heavy_modules'])}")
+    etapa = 'window_s' if 'window_s' in startup else 'import_s'
+    if startup[etapa] > budget:
+        problemas.append(f"{etapa} {startup[etapa]:.3f}s acima do orçamento de {budget:.3f}s")
+    return problemas
+
+def compare(current, previous, threshold):
+    """Lista (size, engine, etapa, antes, agora, razão) das etapas mais lentas que `threshold`x."""
+    anteriores = {(r['size'], r['engine']): r for r in previous.get('results', [])}
+    regressoes = []
+    for r in current['results']:
+        old = anteriores.get((r['size'], r['engine']))
+        if old is None:
+            continue
+        for stage, v in r['stages'].items():
+            antes = old['stages'].get(stage, {}).get('seconds')
+            if not antes:
+                continue
+            razao = v['seconds'] / antes
+            if razao > threshold:
+                regressoes.append((r['size'], r['engine'], stage, antes, v['seconds'], razao))
+    return regressoes
+
+def build_parser():
+    p = argparse.ArgumentParser(description="Benchmark do pipeline de reconciliação com dados sintéticos.")
+    p.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="linhas de entrada por execução")
+    p.add_argument('--engines', nargs='+', choices=list(ENGINES), default=['vectorized', 'loop'])
+    p.add_argument('--days', type=int, default=30)
+    p.add_argument('--density', type=float, default=0.3, help="probabilidade de compra/venda por produto/dia")
+    p.add_argument('--rate', type=float, default=0.01, help="fração injetada de cada tipo de discrepância")
+    p.add_argument('--seed', type=int, default=0)
+    p.add_argument('--no-memory', action='store_true', help="não mede pico de memória (tracemalloc)")
+    p.add_argument('--loop-max-rows', type=int, default=20_000, help="maior entrada executada com o motor 'loop'")
+    p.add_argument('-o', '--output', help="grava os resultados em JSON")
+    p.add_argument('--compare', help="JSON de uma execução anterior para comparação")
+    p.add_argument('--threshold', type=float, default=1.2, help="razão de tempo considerada regressão")
+    p.add_argument('--startup', action='store_true', help="mede também a partida da interface (main.py)")
+    p.add_argument('--startup-budget', type=float, default=STARTUP_BUDGET_S,
+                   help="segundos até a janela aparecer (sem display, até importar main.py)")
+    return p
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(format='%(levelname)s: %(message)s')
+    logging.getLogger().setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    memory = not args.no_memory
+    if memory:
+        tracemalloc.start()
+    results = []
+    for rows in args.sizes:
+        results += run_size(rows, args.engines, args.days, args.density, args.rate, seed=args.seed,
+                            memory=memory, loop_max_rows=args.loop_max_rows)
+    if memory:
+        tracemalloc.stop()
+
+    current = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    if args.startup:
+        current['startup'] = measure_startup()
+        logger.info("Partida: " + ", ".join(f"{k} {v}" for k, v in current['startup'].items()))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as fh:
+            json.dump(current, fh, indent=2, ensure_ascii=False)
+
+    status = 0
+    if not all(r['verification']['ok'] for r in results):
+        print("Relatório divergente das discrepâncias injetadas.", file=sys.stderr)
+        status = 1
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as fh:
+            regressoes = compare(current, json.load(fh), args.threshold)
+        for size, engine, stage, antes, agora, razao in regressoes:
+            print(f"Regressão: {size} [{engine}] {stage}: {antes:.3f}s -> {agora:.3f}s ({razao:.2f}x)", file=sys.stderr)
+        if regressoes:
+            status = 1
+    if args.startup:
+        for problema in check_startup(current['startup'], args.startup_budget):
+            print(f"Partida: {problema}", file=sys.stderr)
+            status = 1
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
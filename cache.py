@@ -0,0 +1,130 @@
+# cache.py
+import os
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger("cache")
+
+DEFAULT_CACHE_DIR = os.environ.get('CONSISTENCIA_CACHE_DIR', os.path.join(os.path.expanduser('~'), '.cache', 'consistencia'))
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+# Entra na chave: incrementar quando o conteúdo gravado ou a forma de ler as entradas mudar
+# (ex.: nova opção de conversão), para que entradas antigas deixem de casar
+CACHE_FORMAT = 3
+
+def _file_digest(path, block=1024 * 1024):
+    h = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for bloco in iter(lambda: fh.read(block), b''):
+            h.update(bloco)
+    return h.hexdigest()
+
+class InputCache:
+    """
+    Cache local das entradas já normalizadas e agregadas por (produto, data).
+
+    Cada entrada é gravada em formato colunar binário (.npz do NumPy, sem
+    dependências extras): produto como códigos int32 + categorias, data
+    como int64 e a coluna de quantidade no dtype original, junto das linhas
+    rejeitadas na leitura (ver `loaders.ERROR_COLUMNS`), para que um acerto
+    repita o mesmo aviso da primeira leitura. A chave combina
+    caminho, tamanho e mtime do arquivo (e, com `use_hash=True`, o SHA-1 do
+    conteúdo). O diretório respeita `max_bytes`, descartando as entradas
+    usadas há mais tempo (LRU pelo mtime, renovado a cada acerto).
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES, use_hash=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.use_hash = use_hash
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, path, qty_col, keys=('produto',), date_format=None):
+        """Chave da entrada: arquivo (caminho, tamanho, mtime), coluna, chaves e opções de leitura (`date_format`)."""
+        st = os.stat(path)
+        parts = [os.path.abspath(path), str(st.st_size), str(st.st_mtime_ns), qty_col, f'v{CACHE_FORMAT}', str(date_format)]
+        if tuple(keys) != ('produto',):
+            parts.append(','.join(keys))
+        if self.use_hash:
+            parts.append(_file_digest(path))
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, path, qty_col, keys=('produto',), errors=None, date_format=None):
+        """
+        Frame agregado em cache para `path`, ou None se não houver entrada válida.
+
+        Se `errors` (lista) for informado e a leitura original rejeitou linhas,
+        recebe o frame dessas linhas.
+        """
+        entry = self._entry_path(self.key(path, qty_col, keys, date_format))
+        if not os.path.exists(entry):
+            return None
+        try:
+            with np.load(entry, allow_pickle=False) as z:
+                cols = {k: pd.Categorical.from_codes(z[f'{k}_codes'], categories=z[f'{k}_categories']) for k in keys}
+                cols['data'] = z['data'].view(str(z['data_dtype']))
+                cols[qty_col] = z['quantidade']
+                df = pd.DataFrame(cols)
+                rejeitadas = None
+                if len(z['erros_linha']):
+                    valor = z['erros_valor'].astype(object)
+                    valor[z['erros_valor_nulo']] = None
+                    rejeitadas = pd.DataFrame({'linha': z['erros_linha'], 'coluna': z['erros_coluna'].astype(object),
+                                               'valor': valor, 'motivo': z['erros_motivo'].astype(object)})
+        except Exception as e:
+            logger.warning(f"Entrada de cache inválida ({entry}): {e}")
+            os.remove(entry)
+            return None
+        os.utime(entry)
+        if rejeitadas is not None and errors is not None:
+            errors.append(rejeitadas)
+        return df
+
+    def put(self, path, qty_col, agg, keys=('produto',), errors=None, date_format=None):
+        """Grava o frame agregado de `path` (e as linhas rejeitadas `errors`, um frame) e aplica o limite de tamanho."""
+        entry = self._entry_path(self.key(path, qty_col, keys, date_format))
+        chaves = {}
+        for k in keys:
+            codes, categorias = pd.factorize(agg[k], sort=True)
+            chaves[f'{k}_codes'] = codes.astype(np.int32)
+            chaves[f'{k}_categories'] = np.asarray(categorias.to_numpy(), dtype=str)
+        data = pd.to_datetime(agg['data']).to_numpy()
+        if errors is None:
+            errors = pd.DataFrame({'linha': [], 'coluna': [], 'valor': [], 'motivo': []})
+        valor = errors['valor']
+        tmp = entry + '.tmp'
+        with open(tmp, 'wb') as fh:
+            np.savez(fh,
+                     **chaves,
+                     data=data.view(np.int64),
+                     data_dtype=np.array(str(data.dtype)),
+                     quantidade=pd.to_numeric(agg[qty_col]).to_numpy(),
+                     erros_linha=errors['linha'].to_numpy(dtype=np.int64),
+                     erros_coluna=np.asarray(errors['coluna'], dtype=str),
+                     erros_valor=np.asarray(valor.astype(str), dtype=str),
+                     erros_valor_nulo=valor.isna().to_numpy(dtype=bool),
+                     erros_motivo=np.asarray(errors['motivo'], dtype=str))
+        os.replace(tmp, entry)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for nome in os.listdir(self.cache_dir):
+            if nome.endswith('.npz'):
+                st = os.stat(os.path.join(self.cache_dir, nome))
+                entries.append((st.st_mtime, st.st_size, nome))
+        total = sum(size for _, size, _ in entries)
+        for _, size, nome in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_dir, nome))
+            total -= size
+
+    def clear(self):
+        for nome in os.listdir(self.cache_dir):
+            if nome.endswith('.npz'):
+                os.remove(os.path.join(self.cache_dir, nome))
@@ -0,0 +1,215 @@
+# cli.py
+"""
+Execução em lote (sem interface gráfica) da detecção de discrepâncias.
+
+Exemplo:
+    python cli.py compras.csv vendas.csv estoque.csv -t 2 -o relatorio.csv --store sessao.db
+    python cli.py --session sessao.db --tipo falta_registro_compra --limit 50
+    python cli.py --session sessao.db --produto SKU001 --historico
+    python cli.py compras.csv vendas.csv estoque.csv --keys loja produto -o relatorio.csv --summary lojas.csv
+"""
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+
+import pandas as pd
+
+from core import (DEFAULT_KEYS, ENGINES, decode_keys, encode_keys, iter_reconcile, reconcile_aggregated,
+                  reconcile_parallel, render_report, summarize_groups)
+from streaming import DEFAULT_CHUNKSIZE, load_aggregated
+from export import report_writer
+from cache import InputCache
+from loaders import DATE_FORMAT
+from store import ReconciliationStore
+import perf
+
+logger = logging.getLogger("cli")
+
+STAGES = ['load', 'normalize', 'aggregate', 'reconcile', 'write']
+
+def build_parser():
+    p = argparse.ArgumentParser(description="Detecta discrepâncias de estoque a partir de CSVs ou planilhas de compras, vendas e estoque.")
+    p.add_argument('compras', nargs='?', help="CSV ou planilha .xlsx (aba 'compras') de compras (data, produto, quantidade_comprada)")
+    p.add_argument('vendas', nargs='?', help="CSV ou planilha .xlsx (aba 'vendas') de vendas (data, produto, quantidade_vendida)")
+    p.add_argument('estoque', nargs='?', help="CSV ou planilha .xlsx (aba 'estoque') de estoque (data, produto, quantidade_em_estoque)")
+    p.add_argument('-o', '--output', help="arquivo de saída (.csv, .csv.gz/.bz2/.xz ou .parquet)")
+    p.add_argument('-t', '--tolerance', type=int, default=0, help="diferença aceitável (padrão: 0)")
+    p.add_argument('--engine', choices=list(ENGINES), default='vectorized', help="motor de reconciliação")
+    p.add_argument('--workers', type=int, default=1, help="processos para reconciliação paralela (>1 ativa o modo paralelo)")
+    p.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help="linhas por bloco na leitura dos CSVs")
+    p.add_argument('--batch-size', type=int, default=5000, help="produtos por bloco gravado no modo streaming")
+    p.add_argument('--keys', nargs='+', default=list(DEFAULT_KEYS), metavar='COLUNA',
+                   help="colunas que identificam cada cadeia de estoque (padrão: produto; ex.: --keys loja deposito produto)")
+    p.add_argument('--summary', help="grava em CSV o resumo das discrepâncias por grupo (ver --summary-by)")
+    p.add_argument('--summary-by', nargs='+', metavar='COLUNA',
+                   help="colunas do resumo (padrão: todas as --keys menos a última, ex.: loja)")
+    p.add_argument('--date-format', default=DATE_FORMAT, help=f"formato das datas nos CSVs (padrão: {DATE_FORMAT.replace('%', '%%')}); outras datas passam pela conversão genérica")
+    p.add_argument('--rejects', help="grava em CSV as linhas de entrada ignoradas por erro de conversão")
+    p.add_argument('--cache-dir', help="habilita o cache de entradas normalizadas neste diretório")
+    p.add_argument('--metrics', help="grava em JSON as métricas por etapa (tempo, linhas, produtos/s, memória)")
+    p.add_argument('--trace-memory', action='store_true', help="inclui o pico de memória por etapa nas métricas (tracemalloc; mais lento)")
+    p.add_argument('--profile', help="grava um perfil cProfile da execução neste arquivo (.prof)")
+    p.add_argument('--store', help="grava também a sessão (movimentos e relatório) neste arquivo SQLite")
+    consulta = p.add_argument_group("consulta a uma sessão gravada (sem recalcular)")
+    consulta.add_argument('--session', help="arquivo SQLite gravado com --store (ou pela interface); imprime CSV na saída padrão")
+    consulta.add_argument('--produto', help="filtra as discrepâncias de um produto")
+    consulta.add_argument('--tipo', help="filtra por tipo de discrepância")
+    consulta.add_argument('--historico', action='store_true', help="movimentos dia a dia do --produto, em vez das discrepâncias")
+    consulta.add_argument('--offset', type=int, default=0, help="primeira linha da página")
+    consulta.add_argument('--limit', type=int, default=100, help="linhas por página (0: todas)")
+    p.add_argument('-q', '--quiet', action='store_true', help="não imprime os tempos por etapa")
+    return p
+
+def _staged(chunks, stage):
+    """Repassa os blocos de um gerador medindo, na etapa `stage`, o tempo gasto para produzi-los."""
+    it = iter(chunks)
+    while True:
+        with perf.stage(stage) as st:
+            chunk = next(it, None)
+            st.count('rows_out', 0 if chunk is None else len(chunk))
+        if chunk is None:
+            return
+        yield chunk
+
+def format_timings(timings, total_rows):
+    linhas = [f"{stage:<10} {timings.get(stage, 0.0):9.3f}s" for stage in STAGES]
+    linhas.append(f"{'total':<10} {sum(timings.get(s, 0.0) for s in STAGES):9.3f}s")
+    linhas.append(f"discrepâncias: {total_rows}")
+    return "\n".join(linhas)
+
+def run(args):
+    """
+    Executa a reconciliação descrita por `args`; retorna as linhas gravadas.
+
+    Os tempos por etapa (`STAGES`) saem do `perf.Recorder` ativo (ver `main`).
+    """
+    cache = InputCache(args.cache_dir) if args.cache_dir else None
+    rejeitadas = {}
+    aggs = load_aggregated(args.compras, args.vendas, args.estoque, args.chunksize, cache=cache,
+                           date_format=args.date_format, errors=rejeitadas, keys=args.keys)
+    if args.rejects and rejeitadas:
+        pd.concat([e.assign(entrada=nome) for nome, e in rejeitadas.items()], ignore_index=True).to_csv(args.rejects, index=False)
+    chaves = None
+    if args.keys != list(DEFAULT_KEYS):
+        # Chave composta: todos os grupos (ex.: loja/produto) são reconciliados de uma vez por um código inteiro
+        with perf.stage('encode_keys'):
+            aggs, chaves = encode_keys(*aggs, args.keys)
+
+    resumos = []
+    by = args.summary_by or args.keys[:-1] or args.keys
+    if args.workers > 1 or args.engine != 'vectorized':
+        if args.workers > 1:
+            with perf.stage('reconcile') as st:
+                report = reconcile_parallel(*aggs, tolerance=args.tolerance, engine=args.engine, workers=args.workers)
+                st.count('rows_out', len(report))
+        else:
+            report = reconcile_aggregated(*aggs, tolerance=args.tolerance, engine=args.engine)
+        if chaves is not None and not report.empty:
+            report = decode_keys(report, chaves)
+        if args.summary:
+            # Relatório inteiro em memória: um único resumo (os blocos abaixo podem partir um grupo)
+            resumos.append(summarize_groups(report, by))
+        chunks = [] if report.empty else [report[i:i + 100_000] for i in range(0, len(report), 100_000)]
+    else:
+        # Vetorizado em série: reconcilia e grava bloco a bloco, sem montar o relatório inteiro
+        chunks = _staged(iter_reconcile(*aggs, tolerance=args.tolerance, batch_size=args.batch_size), 'reconcile')
+        if chaves is not None:
+            chunks = (decode_keys(chunk, chaves) for chunk in chunks)
+        if args.summary:
+            # `iter_reconcile` nunca divide uma cadeia (chave completa) entre blocos,
+            # então os resumos por bloco podem ser somados
+            chunks = _summarized(chunks, by, resumos)
+
+    if args.store:
+        store = ReconciliationStore(args.store)
+        chunks = store.tee(chunks, aggs, tolerancia=args.tolerance, compras=args.compras, vendas=args.vendas, estoque=args.estoque)
+    writer = report_writer(args.output)
+    try:
+        # A reconciliação em streaming acontece dentro da gravação ('write/reconcile');
+        # `stage_timings` conta esse tempo só em 'reconcile'
+        with perf.stage('write'):
+            total = writer(chunks, args.output, keys=args.keys)
+    finally:
+        if args.store:
+            store.close()
+    if args.summary:
+        resumo = pd.concat(resumos, ignore_index=True).groupby(by, as_index=False, observed=True).sum() if resumos \
+            else summarize_groups(pd.DataFrame(), by)
+        resumo.to_csv(args.summary, index=False)
+    return total
+
+def stage_timings(recorder):
+    """Segundos de cada etapa de `STAGES` (sem o tempo das outras etapas de `STAGES` aninhadas)."""
+    return recorder.exclusive_seconds(STAGES)
+
+def _summarized(chunks, by, resumos):
+    """Repassa os blocos guardando em `resumos` o resumo por `by` de cada um."""
+    for chunk in chunks:
+        resumos.append(summarize_groups(chunk, by))
+        yield chunk
+
+def query(args, out=sys.stdout):
+    """Imprime em CSV uma página (ou o histórico de um produto) de uma sessão gravada; retorna o nº de linhas."""
+    if not os.path.exists(args.session):
+        raise FileNotFoundError(f"Sessão não encontrada: {args.session}")
+    with ReconciliationStore(args.session) as store:
+        if args.historico:
+            df = store.history(args.produto)
+            if args.limit:
+                df = df.iloc[args.offset:args.offset + args.limit]
+        elif args.limit:
+            df = render_report(store.page(args.offset, args.limit, produto=args.produto, tipo=args.tipo))
+        else:
+            df = render_report(store.report(produto=args.produto, tipo=args.tipo)).iloc[args.offset:]
+    if not df.empty:
+        df.to_csv(out, index=False, date_format='%Y-%m-%d')
+    return len(df)
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.session:
+        if args.historico and not args.produto:
+            parser.error("--historico exige --produto")
+    elif not (args.compras and args.vendas and args.estoque and args.output):
+        parser.error("informe compras, vendas, estoque e -o/--output (ou --session para consultar uma sessão)")
+    elif args.store and args.keys != list(DEFAULT_KEYS):
+        parser.error("--store só guarda sessões com a chave padrão (produto)")
+    elif args.summary_by and not set(args.summary_by) <= set(args.keys):
+        parser.error("--summary-by deve usar colunas de --keys")
+    logging.basicConfig(format='%(levelname)s: %(message)s')
+    logging.getLogger().setLevel(logging.WARNING if args.quiet or args.session else logging.INFO)
+    if args.session:
+        try:
+            query(args)
+        except (OSError, sqlite3.Error) as e:
+            print(f"Erro: {e}", file=sys.stderr)
+            return 1
+        return 0
+    # Sempre ativo: os tempos por etapa impressos saem dele; memória e perfil só quando pedidos
+    recorder = perf.Recorder(memory=args.trace_memory, profile=bool(args.profile))
+    try:
+        with recorder:
+            total = run(args)
+    except (OSError, ValueError, ImportError) as e:
+        print(f"Erro: {e}", file=sys.stderr)
+        return 1
+    timings = stage_timings(recorder)
+    if not args.quiet:
+        print(format_timings(timings, total), file=sys.stderr)
+    if args.metrics or args.profile:
+        if args.profile:
+            recorder.dump_profile(args.profile)
+        if args.metrics:
+            metrics = {'timings': timings, 'report_rows': total, **recorder.to_dict()}
+            with open(args.metrics, 'w', encoding='utf-8') as fh:
+                json.dump(metrics, fh, indent=2, ensure_ascii=False)
+        if not args.quiet:
+            print(recorder.format(), file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
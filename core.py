@@ -1,29 +1,30 @@
 # core.py
+import os
+import numpy as np
 import pandas as pd
-from dataclasses import dataclass
-from typing import Optional
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import logging
+import perf
 
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger("consistencia")
 
-@dataclass
-class Discrepancy:
-    produto: str
-    data: pd.Timestamp
-    estoque_anterior: Optional[int]
-    compras: int
-    vendas: int
-    estoque_atual: Optional[int]
-    estoque_esperado: Optional[int]
-    diferenca: Optional[int]
-    tipo: str
-    sugestao: str
+REPORT_COLUMNS = ['produto','data','estoque_anterior','compras','vendas','estoque_atual',
+                  'estoque_esperado','diferenca','tipo_discrepancia','sugestao']
+
+class ReconciliationCancelled(Exception):
+    """Reconciliação interrompida pelo callback `cancel`."""
+
+def _check_cancel(cancel):
+    if cancel is not None and cancel():
+        raise ReconciliationCancelled("Reconciliação cancelada")
 
 def _ensure_df(df, cols, date_col='data'):
     """Valida/normaliza DataFrame: garante colunas e tipos."""
     if df is None:
         return pd.DataFrame(columns=cols)
+    if list(df.columns) == cols and pd.api.types.is_datetime64_dtype(df[date_col]):
+        # Já normalizado (ex.: saída de `loaders`): sem cópia nem nova conversão de datas
+        return df
     df = df.copy()
     if date_col in df.columns:
         df[date_col] = pd.to_datetime(df[date_col])
@@ -34,30 +35,204 @@ def _ensure_df(df, cols, date_col='data'):
             df[c] = 0 if c != date_col else pd.NaT
     return df[cols]
 
-def detect_discrepancies(compras_df, vendas_df, estoque_df, tolerance=0):
+# Chave padrão de cada cadeia de estoque; `keys` permite outras (ex.: loja, deposito, produto)
+DEFAULT_KEYS = ('produto',)
+
+def _aggregate_movements(compras, vendas, estoque, keys=DEFAULT_KEYS):
+    """Soma os movimentos por chave/dia (uma linha por chave em cada tabela)."""
+    by = [*keys, 'data']
+    compras_agg = compras.groupby(by, as_index=False, observed=True).quantidade_comprada.sum()
+    vendas_agg = vendas.groupby(by, as_index=False, observed=True).quantidade_vendida.sum()
+    estoque_agg = estoque.groupby(by, as_index=False, observed=True).quantidade_em_estoque.sum()
+    return compras_agg, vendas_agg, estoque_agg
+
+def _check_keys(keys):
+    keys = list(dict.fromkeys(keys or DEFAULT_KEYS))
+    reservadas = {'data', 'quantidade_comprada', 'quantidade_vendida', 'quantidade_em_estoque'}
+    if reservadas & set(keys):
+        raise ValueError(f"Colunas não podem ser chave: {', '.join(sorted(reservadas & set(keys)))}")
+    return keys
+
+def encode_keys(compras_agg, vendas_agg, estoque_agg, keys):
     """
-    Detecta discrepâncias entre Compras, Vendas e Estoque.
+    Troca as colunas `keys` por um código inteiro de grupo na coluna 'produto'.
 
-    Retorna um DataFrame com:
-    - produto, data, estoque_anterior, compras, vendas, estoque_atual
-    - estoque_esperado, diferenca, tipo_discrepancia, sugestao
+    Os códigos seguem a ordem das chaves, então qualquer motor (que só
+    conhece produto/data) reconcilia todos os grupos de uma vez e na ordem
+    certa. Retorna (agregações codificadas, frame grupo -> chaves) para
+    `decode_keys`.
     """
-    # Normalizar
-    compras = _ensure_df(compras_df, ['data','produto','quantidade_comprada'])
-    vendas = _ensure_df(vendas_df, ['data','produto','quantidade_vendida'])
-    estoque = _ensure_df(estoque_df, ['data','produto','quantidade_em_estoque'])
+    keys = _check_keys(keys)
+    aggs = (compras_agg, vendas_agg, estoque_agg)
+    todas = pd.concat([a[keys] for a in aggs], ignore_index=True)
+    grupos = todas.groupby(keys, sort=True, observed=True, dropna=False)
+    codes = grupos.ngroup().to_numpy()
+    chaves = grupos.size().index.to_frame(index=False)
+    codificadas, inicio = [], 0
+    for a in aggs:
+        cod = a.drop(columns=keys)
+        cod.insert(0, 'produto', codes[inicio:inicio + len(a)])
+        codificadas.append(cod)
+        inicio += len(a)
+    return tuple(codificadas), chaves
+
+def decode_keys(report, chaves):
+    """Relatório de `encode_keys` com as colunas de chave no lugar do código de grupo."""
+    if report.empty:
+        return report
+    codes = report['produto'].to_numpy(dtype=np.int64)
+    cols = {k: chaves[k].array.take(codes) for k in chaves.columns}
+    cols.update({c: report[c].array for c in report.columns if c != 'produto'})
+    return pd.DataFrame(cols, index=report.index, copy=False)
+
+# Tipos de discrepância e modelos de sugestão: o relatório guarda apenas os
+# códigos (colunas categóricas); os números entram no texto só ao exibir/exportar
+TIPOS = ['sem_baseline', 'estoque_nao_informado', 'falta_registro_compra',
+         'falta_registro_venda', 'erro_lancamento_estoque']
+SUGESTOES = {
+    'sem_baseline': 'Não há registro de estoque inicial para validar.',
+    'nao_informado': 'Registro de estoque ausente.',
+    'baseline_compra': 'Sugerir adicionar compra de {diff} unidades.',
+    'baseline_venda': 'Sugerir adicionar venda de {neg} unidades.',
+    'baseline_revisar': 'Revisar lançamento de estoque ou registros do dia.',
+    'compra': 'Adicionar compra de {diff} unidades ou ajustar estoque para {esp}.',
+    'venda': 'Adicionar venda de {neg} unidades ou ajustar estoque para {esp}.',
+    'revisar_compras': 'Revisar lançamento de estoque (diferenca +{diff}) e validar compras.',
+    'revisar_vendas': 'Revisar lançamento de estoque (diferenca {diff}) e validar vendas.',
+}
+TIPO_DTYPE = pd.CategoricalDtype(TIPOS)
+SUGESTAO_DTYPE = pd.CategoricalDtype(list(SUGESTOES.values()))
+_TIPO_CODE = {t: i for i, t in enumerate(TIPOS)}
+_SUGESTAO_CODE = {k: i for i, k in enumerate(SUGESTOES)}
+
+def format_sugestao(modelo, diferenca=None, esperado=None):
+    """Texto de uma sugestão a partir do seu modelo e dos números da linha."""
+    if '{' not in modelo:
+        return modelo
+    return modelo.format(diff=diferenca, neg=-diferenca, esp=esperado)
+
+def factorize_sugestao(report):
+    """
+    Códigos por linha + textos distintos da coluna `sugestao`.
+
+    Cada combinação (modelo, diferença, esperado) é formatada uma única vez;
+    modelos sem números não distinguem as linhas. Aceita também uma coluna
+    já renderizada (texto).
+    """
+    sug = report['sugestao']
+    if not isinstance(sug.dtype, pd.CategoricalDtype):
+        codes, uniques = pd.factorize(sug)
+        return codes, list(uniques)
+    modelos = list(sug.cat.categories)
+    codes = sug.cat.codes.to_numpy()
+    com_numeros = np.array(['{' in m for m in modelos] + [False])[codes]
+    diff = np.where(com_numeros, report['diferenca'].to_numpy(dtype='int64', na_value=0), 0)
+    esp = np.where(com_numeros, report['estoque_esperado'].to_numpy(dtype='int64', na_value=0), 0)
+    codes, uniques = pd.factorize(pd.MultiIndex.from_arrays([codes, diff, esp]))
+    textos = [format_sugestao(modelos[m], d, e) if m >= 0 else None for m, d, e in uniques]
+    return codes, textos
+
+def render_sugestao(report):
+    """Coluna `sugestao` com o texto final de cada linha."""
+    if report.empty:
+        return pd.Series([], index=report.index, dtype=object, name='sugestao')
+    codes, textos = factorize_sugestao(report)
+    return pd.Series(np.array(textos, dtype=object)[codes], index=report.index, name='sugestao')
+
+def render_report(report):
+    """Cópia do relatório com as sugestões formatadas (para exportação)."""
+    if report.empty:
+        return report
+    return report.assign(sugestao=render_sugestao(report))
+
+def _nullable(values, valid):
+    """Inteiro anulável (Int64) sobre o próprio array de valores, sem cópia."""
+    return pd.arrays.IntegerArray(values, ~valid)
+
+def _report_frame(produto, data, compras, vendas, estoques, tipo, sugestao):
+    """
+    Monta o relatório a partir de arrays já tipados, sem copiá-los.
+
+    `estoques` mapeia cada coluna anulável (estoque_anterior, estoque_atual,
+    estoque_esperado, diferenca) para (valores int64, válidos); `tipo` e
+    `sugestao` são códigos das categorias fixas.
+    """
+    if not len(tipo):
+        return pd.DataFrame()
+    cols = {'produto': produto, 'data': data, 'compras': compras, 'vendas': vendas}
+    for col, (values, valid) in estoques.items():
+        cols[col] = _nullable(values, valid)
+    cols['tipo_discrepancia'] = pd.Categorical.from_codes(tipo, dtype=TIPO_DTYPE)
+    cols['sugestao'] = pd.Categorical.from_codes(sugestao, dtype=SUGESTAO_DTYPE)
+    return pd.DataFrame({c: cols[c] for c in REPORT_COLUMNS}, copy=False)
+
+class _ReportBuilder:
+    """
+    Acumulador colunar das discrepâncias do motor `loop`.
+
+    Arrays tipados pré-alocados (a capacidade dobra quando enche), sem um
+    objeto por linha: datas em int64 (ns), estoques como valor + máscara de
+    válidos, tipo e sugestão como códigos.
+    """
+    ESTOQUES = ('estoque_anterior', 'estoque_atual', 'estoque_esperado', 'diferenca')
+    __slots__ = ('n', 'produto', 'data', 'compras', 'vendas', 'valores', 'validos', 'tipo', 'sugestao')
 
-    # Somar movimentos por dia/produto
-    compras_agg = compras.groupby(['produto','data'], as_index=False).quantidade_comprada.sum()
-    vendas_agg = vendas.groupby(['produto','data'], as_index=False).quantidade_vendida.sum()
-    estoque_agg = estoque.groupby(['produto','data'], as_index=False).quantidade_em_estoque.sum()
+    def __init__(self, capacity=1024):
+        self.n = 0
+        self.produto = np.empty(capacity, dtype=object)
+        self.data = np.empty(capacity, dtype=np.int64)
+        self.compras = np.empty(capacity, dtype=np.int64)
+        self.vendas = np.empty(capacity, dtype=np.int64)
+        # Uma coluna por estoque anulável (ordem de ESTOQUES); Fortran para colunas contíguas
+        self.valores = np.zeros((capacity, len(self.ESTOQUES)), dtype=np.int64, order='F')
+        self.validos = np.zeros((capacity, len(self.ESTOQUES)), dtype=bool, order='F')
+        self.tipo = np.empty(capacity, dtype=np.int8)
+        self.sugestao = np.empty(capacity, dtype=np.int8)
 
+    def _grow(self):
+        for nome in ('produto', 'data', 'compras', 'vendas', 'valores', 'validos', 'tipo', 'sugestao'):
+            atual = getattr(self, nome)
+            novo = np.zeros((2 * len(atual),) + atual.shape[1:], dtype=atual.dtype, order='F')
+            novo[:self.n] = atual[:self.n]
+            setattr(self, nome, novo)
+
+    def append(self, produto, data, estoque_anterior, compras, vendas, estoque_atual,
+               estoque_esperado, diferenca, tipo, sugestao):
+        if self.n == len(self.data):
+            self._grow()
+        i = self.n
+        self.produto[i] = produto
+        self.data[i] = data.value
+        self.compras[i] = compras
+        self.vendas[i] = vendas
+        for j, x in enumerate((estoque_anterior, estoque_atual, estoque_esperado, diferenca)):
+            if x is not None:
+                self.valores[i, j] = x
+                self.validos[i, j] = True
+        self.tipo[i] = _TIPO_CODE[tipo]
+        self.sugestao[i] = _SUGESTAO_CODE[sugestao]
+        self.n += 1
+
+    def build(self, data_dtype='datetime64[ns]'):
+        n = self.n
+        estoques = {col: (self.valores[:n, j], self.validos[:n, j]) for j, col in enumerate(self.ESTOQUES)}
+        data = self.data[:n].view('datetime64[ns]').astype(data_dtype, copy=False)
+        return _report_frame(self.produto[:n], data, self.compras[:n], self.vendas[:n],
+                             estoques, self.tipo[:n], self.sugestao[:n])
+
+def _detect_loop(compras_agg, vendas_agg, estoque_agg, tolerance=0, progress=None, cancel=None):
+    """Implementação de referência: percorre produto a produto, dia a dia."""
     produtos = sorted(set(compras_agg['produto']).union(vendas_agg['produto']).union(estoque_agg['produto']))
-    logger.info(f"Produtos encontrados: {produtos}")
+    logger.info(f"Produtos encontrados: {len(produtos)}")
+    perf.count('products', len(produtos))
 
-    discrepancias = []
+    discrepancias = _ReportBuilder()
+    data_dtype = next((a['data'].dtype for a in (compras_agg, vendas_agg, estoque_agg) if len(a)), 'datetime64[ns]')
 
-    for prod in produtos:
+    for i, prod in enumerate(produtos):
+        _check_cancel(cancel)
+        if progress is not None and i:
+            progress(i, len(produtos))
         dates = sorted(set(
             compras_agg.loc[compras_agg['produto']==prod,'data'].tolist() +
             vendas_agg.loc[vendas_agg['produto']==prod,'data'].tolist() +
@@ -76,24 +251,21 @@ def detect_discrepancies(compras_df, vendas_df, estoque_df, tolerance=0):
                     prev_stock = atual
                     expected = prev_stock + c - v
                     diff = None
-                    tipo = 'baseline'
-                    sugestao = 'Registrar histórico anterior de estoque para validação.'
                     if c!=0 or v!=0 and abs(atual - expected) > tolerance:
                         if atual - expected > 0 and c==0:
                             tipo = 'falta_registro_compra'
-                            sugestao = f'Sugerir adicionar compra de {atual - expected} unidades.'
+                            sugestao = 'baseline_compra'
                         elif atual - expected < 0 and v==0:
                             tipo = 'falta_registro_venda'
-                            sugestao = f'Sugerir adicionar venda de {- (atual - expected)} unidades.'
+                            sugestao = 'baseline_venda'
                         else:
                             tipo = 'erro_lancamento_estoque'
-                            sugestao = 'Revisar lançamento de estoque ou registros do dia.'
-                        discrepancias.append(Discrepancy(prod, d, prev_stock, c, v, atual, expected, atual - expected, tipo, sugestao))
+                            sugestao = 'baseline_revisar'
+                        discrepancias.append(prod, d, prev_stock, c, v, atual, expected, atual - expected, tipo, sugestao)
                     continue
                 else:
                     tipo = 'sem_baseline'
-                    sugestao = 'Não há registro de estoque inicial para validar.'
-                    discrepancias.append(Discrepancy(prod, d, None, c, v, None, None, None, tipo, sugestao))
+                    discrepancias.append(prod, d, None, c, v, None, None, None, tipo, 'sem_baseline')
                     continue
 
             expected = prev_stock + c - v
@@ -101,8 +273,7 @@ def detect_discrepancies(compras_df, vendas_df, estoque_df, tolerance=0):
 
             if atual is None:
                 tipo = 'estoque_nao_informado'
-                sugestao = 'Registro de estoque ausente.'
-                discrepancias.append(Discrepancy(prod, d, prev_stock, c, v, None, expected, None, tipo, sugestao))
+                discrepancias.append(prod, d, prev_stock, c, v, None, expected, None, tipo, 'nao_informado')
                 continue
 
             if abs(diff) <= tolerance:
@@ -112,37 +283,451 @@ def detect_discrepancies(compras_df, vendas_df, estoque_df, tolerance=0):
             if diff > 0:
                 if c == 0:
                     tipo = 'falta_registro_compra'
-                    sugestao = f'Adicionar compra de {diff} unidades ou ajustar estoque para {expected}.'
+                    sugestao = 'compra'
                 else:
                     tipo = 'erro_lancamento_estoque'
-                    sugestao = f'Revisar lançamento de estoque (diferenca +{diff}) e validar compras.'
+                    sugestao = 'revisar_compras'
             else:
                 if v == 0:
                     tipo = 'falta_registro_venda'
-                    sugestao = f'Adicionar venda de {-diff} unidades ou ajustar estoque para {expected}.'
+                    sugestao = 'venda'
                 else:
                     tipo = 'erro_lancamento_estoque'
-                    sugestao = f'Revisar lançamento de estoque (diferenca {diff}) e validar vendas.'
-            discrepancias.append(Discrepancy(prod, d, prev_stock, c, v, atual, expected, diff, tipo, sugestao))
+                    sugestao = 'revisar_vendas'
+            discrepancias.append(prod, d, prev_stock, c, v, atual, expected, diff, tipo, sugestao)
             prev_stock = atual
 
-    report = pd.DataFrame([{
-        'produto': x.produto,
-        'data': x.data,
-        'estoque_anterior': x.estoque_anterior,
-        'compras': x.compras,
-        'vendas': x.vendas,
-        'estoque_atual': x.estoque_atual,
-        'estoque_esperado': x.estoque_esperado,
-        'diferenca': x.diferenca,
-        'tipo_discrepancia': x.tipo,
-        'sugestao': x.sugestao
-    } for x in discrepancias])
-
-    if not report.empty:
-        report = report.sort_values(['produto','data']).reset_index(drop=True)
+    if progress is not None:
+        progress(len(produtos), len(produtos))
+    return discrepancias.build(data_dtype)
+
+def _as_int(values):
+    """Converte quantidades agregadas para int64 truncando como int() (NaN -> 0)."""
+    values = pd.to_numeric(values).to_numpy(dtype='float64', na_value=np.nan)
+    return np.trunc(np.nan_to_num(values, nan=0.0)).astype(np.int64)
+
+def _build_chains(compras_agg, vendas_agg, estoque_agg, seed=None):
+    """
+    Monta a cadeia diária de cada produto em um único frame (produto, data).
+
+    Junta (outer) as três agregações, ordena por produto/data e calcula, com
+    operações NumPy, o último estoque informado antes de cada dia
+    (`estoque_anterior`). Nada aqui depende da tolerância.
+
+    `seed` (Series produto -> estoque) informa o estoque anterior ao primeiro
+    dia de cada produto, para continuar uma cadeia já reconciliada.
+    """
+    keys = ['produto','data']
+    chains = (compras_agg.merge(vendas_agg, on=keys, how='outer')
+                         .merge(estoque_agg, on=keys, how='outer'))
+    chains = chains.sort_values(keys, kind='mergesort').reset_index(drop=True)
+
+    n = len(chains)
+    tem_atual = chains['quantidade_em_estoque'].notna().to_numpy()
+    idx = np.arange(n)
+    # início do grupo (produto) de cada linha; as linhas já estão ordenadas por produto
+    produtos = chains['produto'].to_numpy()
+    novo_grupo = np.ones(n, dtype=bool)
+    if n > 1:
+        novo_grupo[1:] = produtos[1:] != produtos[:-1]
+    inicio_grupo = np.maximum.accumulate(np.where(novo_grupo, idx, 0))
+    # índice da última linha com estoque informado até i (inclusive) e estritamente antes de i
+    ultimo = np.maximum.accumulate(np.where(tem_atual, idx, -1))
+    anterior = np.empty(n, dtype=np.int64)
+    anterior[:1] = -1
+    anterior[1:] = ultimo[:-1]
+    tem_anterior = anterior >= inicio_grupo
+
+    atual = _as_int(chains['quantidade_em_estoque'])
+    estoque_anterior = np.where(tem_anterior, atual[np.maximum(anterior, 0)], 0)
+    if seed is not None and n:
+        semente = chains['produto'].map(seed)
+        usar = ~tem_anterior & semente.notna().to_numpy()
+        estoque_anterior = np.where(usar, _as_int(semente), estoque_anterior)
+        tem_anterior = tem_anterior | usar
+    return pd.DataFrame({
+        'produto': chains['produto'],
+        'data': chains['data'],
+        'compras': _as_int(chains['quantidade_comprada']),
+        'vendas': _as_int(chains['quantidade_vendida']),
+        'estoque_atual': atual,
+        'tem_atual': tem_atual,
+        'estoque_anterior': estoque_anterior,
+        'tem_anterior': tem_anterior,
+    })
+
+def _chain_terms(chains):
+    """
+    Termos da classificação que não dependem da tolerância (ver `_classify_chains`).
+
+    O tipo e o modelo de sugestão de cada linha são fixos; a tolerância só
+    decide quais linhas entram no relatório: as de `sempre` entram com
+    qualquer tolerância, as de `limiar` quando |diferença| > tolerância.
+    """
+    c = chains['compras'].to_numpy()
+    v = chains['vendas'].to_numpy()
+    atual = chains['estoque_atual'].to_numpy()
+    tem_atual = chains['tem_atual'].to_numpy()
+    tem_ant = chains['tem_anterior'].to_numpy()
+
+    # No dia de baseline o estoque anterior é o próprio estoque do dia
+    ant = np.where(tem_ant, chains['estoque_anterior'].to_numpy(), atual)
+    esperado = ant + c - v
+    diff = atual - esperado
+
+    sem_baseline = ~tem_ant & ~tem_atual
+    baseline = ~tem_ant & tem_atual
+    nao_informado = tem_ant & ~tem_atual
+    comparado = tem_ant & tem_atual
+
+    compra = (diff > 0) & (c == 0)
+    # diferença 0 só chega ao relatório com tolerância negativa; como no loop, cai no ramo de venda
+    venda = ~compra & (diff <= 0) & (v == 0)
+    tipo = np.select(
+        [sem_baseline, nao_informado, compra, venda],
+        [_TIPO_CODE[t] for t in ('sem_baseline', 'estoque_nao_informado', 'falta_registro_compra', 'falta_registro_venda')],
+        default=_TIPO_CODE['erro_lancamento_estoque'],
+    ).astype(np.int8)
+
+    # Apenas o código do modelo; o texto é montado em `render_sugestao`.
+    # Os casos cobrem todas as linhas; -1 (nulo) nunca deveria sobrar
+    sugestao = np.full(len(tipo), -1, dtype=np.int8)
+    casos = [
+        (sem_baseline, 'sem_baseline'),
+        (nao_informado, 'nao_informado'),
+        (baseline & compra, 'baseline_compra'),
+        (baseline & venda, 'baseline_venda'),
+        (baseline & ~compra & ~venda, 'baseline_revisar'),
+        (comparado & compra, 'compra'),
+        (comparado & venda, 'venda'),
+        (comparado & ~compra & ~venda & (diff > 0), 'revisar_compras'),
+        (comparado & ~compra & ~venda & (diff <= 0), 'revisar_vendas'),
+    ]
+    for mask, modelo in casos:
+        sugestao[mask] = _SUGESTAO_CODE[modelo]
+
+    return {
+        'c': c, 'v': v, 'atual': atual, 'tem_atual': tem_atual, 'tem_ant': tem_ant,
+        'ant': ant, 'esperado': esperado, 'diff': diff, 'abs_diff': np.abs(diff),
+        'sem_baseline': sem_baseline, 'tipo': tipo, 'sugestao': sugestao,
+        'sempre': sem_baseline | nao_informado | (baseline & (c != 0)),
+        'limiar': (baseline & (c == 0) & (v != 0)) | comparado,
+    }
+
+def _classify_chains(chains, tolerance=0, terms=None):
+    """
+    Classifica as cadeias diárias e monta o relatório (mesma saída de `_detect_loop`).
+
+    `terms` (de `_chain_terms`) evita recalcular o que não depende da tolerância.
+    """
+    t = _chain_terms(chains) if terms is None else terms
+    keep = t['sempre'] | (t['limiar'] & (t['abs_diff'] > tolerance))
+    if not keep.any():
+        return pd.DataFrame()
+
+    tem_atual, tem_ant, sem_baseline = t['tem_atual'][keep], t['tem_ant'][keep], t['sem_baseline'][keep]
+    estoques = {
+        'estoque_anterior': (t['ant'][keep], tem_ant | tem_atual),
+        'estoque_atual': (t['atual'][keep], tem_atual),
+        'estoque_esperado': (t['esperado'][keep], ~sem_baseline),
+        'diferenca': (t['diff'][keep], tem_atual),
+    }
+    return _report_frame(chains['produto'].to_numpy()[keep], chains['data'].to_numpy()[keep],
+                         t['c'][keep], t['v'][keep], estoques, t['tipo'][keep], t['sugestao'][keep])
+
+# Produtos por bloco quando o motor vetorizado precisa informar progresso/aceitar cancelamento
+PROGRESS_BATCH_SIZE = 1000
+
+class PreparedChains:
+    """
+    Cadeias diárias de uma entrada agregada, montadas uma única vez.
+
+    Junção, ordenação e estoque anterior (`_build_chains`) não dependem da
+    tolerância; com eles prontos, uma nova tolerância só reclassifica as
+    linhas (`reconcile`), e `counts` conta as discrepâncias por tipo por
+    busca binária, sem montar o relatório (prévia ao vivo da tolerância).
+
+    Com `progress`/`cancel` (ver `detect_discrepancies`), as cadeias são
+    montadas em blocos de `batch_size` produtos, como em `iter_reconcile`.
+    """
+
+    def __init__(self, compras_agg, vendas_agg, estoque_agg, progress=None, cancel=None,
+                 batch_size=PROGRESS_BATCH_SIZE):
+        self.aggs = (compras_agg, vendas_agg, estoque_agg)
+        with perf.stage('chains', rows_in=sum(len(a) for a in self.aggs)) as st:
+            if progress is not None or cancel is not None:
+                # Em blocos de produtos, informando o avanço e aceitando cancelamento a cada um
+                self.chains = self._build_in_batches(batch_size, progress, cancel)
+            else:
+                self.chains = _build_chains(compras_agg, vendas_agg, estoque_agg)
+            self.terms = _chain_terms(self.chains)
+            st.count('rows_out', len(self.chains))
+        self.produtos = self.chains['produto'].nunique()
+        perf.count('products', self.produtos)
+
+        # Por tipo: linhas sinalizadas com qualquer tolerância e |diferença| (ordenada) das demais
+        tipo, sempre, limiar = self.terms['tipo'], self.terms['sempre'], self.terms['limiar']
+        self._fixos = np.bincount(tipo[sempre], minlength=len(TIPOS))
+        abs_diff = self.terms['abs_diff'][limiar]
+        self._limiares = [np.sort(abs_diff[tipo[limiar] == i]) for i in range(len(TIPOS))]
+
+    def _build_in_batches(self, batch_size, progress, cancel):
+        partes = []
+        for inicio, total, aggs in _product_batches(self.aggs, batch_size, cancel):
+            partes.append(_build_chains(*aggs))
+            if progress is not None:
+                progress(min(inicio + batch_size, total), total)
+        if not partes:
+            return _build_chains(*self.aggs)
+        return pd.concat(partes, ignore_index=True)
+
+    def __len__(self):
+        return len(self.chains)
+
+    def max_difference(self):
+        """Maior |diferença| que depende da tolerância (acima dela nada mais é sinalizado)."""
+        return max((int(l[-1]) for l in self._limiares if len(l)), default=0)
+
+    def counts(self, tolerance=0):
+        """Discrepâncias por tipo com a `tolerance` dada (dict tipo -> quantidade)."""
+        return {t: int(self._fixos[i] + len(l) - np.searchsorted(l, tolerance, side='right'))
+                for i, (t, l) in enumerate(zip(TIPOS, self._limiares))}
+
+    def reconcile(self, tolerance=0, progress=None, cancel=None):
+        """Relatório com a `tolerance` dada (mesma saída de `reconcile_aggregated`)."""
+        _check_cancel(cancel)
+        with perf.stage('classify', rows_in=len(self.chains)) as st:
+            report = _classify_chains(self.chains, tolerance, self.terms)
+            st.count('rows_out', len(report))
+        if progress is not None:
+            progress(self.produtos, self.produtos)
+        return report
+
+def _detect_vectorized(compras_agg, vendas_agg, estoque_agg, tolerance=0, progress=None, cancel=None):
+    """Motor vetorizado: uma única junção (produto, data) + operações NumPy."""
+    if progress is not None or cancel is not None:
+        reports = list(iter_reconcile(compras_agg, vendas_agg, estoque_agg, tolerance,
+                                      PROGRESS_BATCH_SIZE, progress=progress, cancel=cancel))
+        with perf.stage('concat'):
+            return pd.concat(reports, ignore_index=True) if reports else pd.DataFrame()
+    with perf.stage('chains'):
+        chains = _build_chains(compras_agg, vendas_agg, estoque_agg)
+    produtos = chains['produto'].nunique()
+    logger.info(f"Produtos encontrados: {produtos}")
+    perf.count('products', produtos)
+    with perf.stage('classify', rows_in=len(chains)):
+        return _classify_chains(chains, tolerance)
+
+# Motores disponíveis; 'loop' é mantido como implementação de referência
+ENGINES = {
+    'vectorized': _detect_vectorized,
+    'loop': _detect_loop,
+}
+
+def aggregate_inputs(compras_df, vendas_df, estoque_df, keys=DEFAULT_KEYS):
+    """Normaliza as três entradas e soma os movimentos por chave (`keys`)/dia."""
+    keys = _check_keys(keys)
+    # Normalizar
+    with perf.stage('normalize') as st:
+        compras = _ensure_df(compras_df, ['data', *keys, 'quantidade_comprada'])
+        vendas = _ensure_df(vendas_df, ['data', *keys, 'quantidade_vendida'])
+        estoque = _ensure_df(estoque_df, ['data', *keys, 'quantidade_em_estoque'])
+        st.count('rows_out', len(compras) + len(vendas) + len(estoque))
+
+    # Somar movimentos por dia/chave
+    with perf.stage('aggregate', rows_in=len(compras) + len(vendas) + len(estoque)) as st:
+        aggs = _aggregate_movements(compras, vendas, estoque, keys)
+        st.count('rows_out', sum(len(a) for a in aggs))
+    return aggs
+
+def detect_discrepancies(compras_df, vendas_df, estoque_df, tolerance=0, engine='vectorized', workers=None,
+                         progress=None, cancel=None, keys=None):
+    """
+    Detecta discrepâncias entre Compras, Vendas e Estoque.
+
+    Retorna um DataFrame com:
+    - produto, data, estoque_anterior, compras, vendas, estoque_atual
+    - estoque_esperado, diferenca, tipo_discrepancia, sugestao
+
+    Estoques ausentes ficam nulos (Int64); `tipo_discrepancia` e `sugestao`
+    são categóricas, e `sugestao` traz o modelo do texto: use
+    `render_sugestao`/`render_report` para obter o texto final.
+    `engine` escolhe o motor: 'vectorized' (padrão) ou 'loop' (referência).
+    `workers` > 1 reconcilia em paralelo (ver `reconcile_parallel`).
+    `progress(feitos, total)` recebe o avanço em produtos e `cancel()`, se
+    retornar True, interrompe com `ReconciliationCancelled`.
+    `keys` (ex.: ['loja', 'deposito', 'produto']) troca a chave de cada
+    cadeia de estoque; o relatório traz essas colunas no lugar de `produto`
+    (ver `reconcile_grouped` e `summarize_groups`).
+    """
+    if keys is not None and list(keys) != list(DEFAULT_KEYS):
+        aggs = aggregate_inputs(compras_df, vendas_df, estoque_df, keys)
+        return reconcile_grouped(*aggs, keys=keys, tolerance=tolerance, engine=engine, workers=workers,
+                                 progress=progress, cancel=cancel)
+    compras_agg, vendas_agg, estoque_agg = aggregate_inputs(compras_df, vendas_df, estoque_df)
+
+    if workers is not None and workers > 1:
+        with perf.stage('reconcile', rows_in=len(compras_agg) + len(vendas_agg) + len(estoque_agg)) as st:
+            report = reconcile_parallel(compras_agg, vendas_agg, estoque_agg, tolerance, engine, workers,
+                                        progress=progress, cancel=cancel)
+            st.count('rows_out', len(report))
+        return report
+    return reconcile_aggregated(compras_agg, vendas_agg, estoque_agg, tolerance, engine,
+                                progress=progress, cancel=cancel)
+
+def reconcile_aggregated(compras_agg, vendas_agg, estoque_agg, tolerance=0, engine='vectorized',
+                         progress=None, cancel=None):
+    """Reconcilia movimentos já agregados por produto/dia (saída de `_aggregate_movements`)."""
+    if engine not in ENGINES:
+        raise ValueError(f"Motor desconhecido '{engine}'. Opções: {', '.join(ENGINES)}")
+    with perf.stage('reconcile', rows_in=len(compras_agg) + len(vendas_agg) + len(estoque_agg)) as st:
+        report = ENGINES[engine](compras_agg, vendas_agg, estoque_agg, tolerance, progress=progress, cancel=cancel)
+        st.count('rows_out', len(report))
     return report
 
+def iter_reconcile(compras_agg, vendas_agg, estoque_agg, tolerance=0, batch_size=5000,
+                   progress=None, cancel=None):
+    """
+    Reconcilia em blocos de `batch_size` produtos, em ordem de produto.
+
+    O estoque anterior reinicia a cada produto, então cada bloco é
+    independente; concatenar os blocos produz o relatório completo.
+    Blocos sem discrepâncias não são emitidos. `progress`/`cancel` são
+    consultados a cada bloco (ver `detect_discrepancies`).
+    """
+    for inicio, total, partes in _product_batches((compras_agg, vendas_agg, estoque_agg), batch_size, cancel):
+        if inicio == 0:
+            perf.count('products', total)
+        with perf.stage('chains'):
+            chains = _build_chains(*partes)
+        with perf.stage('classify', rows_in=len(chains)) as st:
+            report = _classify_chains(chains, tolerance)
+            st.count('rows_out', len(report))
+        if progress is not None:
+            progress(min(inicio + batch_size, total), total)
+        if not report.empty:
+            yield report
+
+def _product_batches(aggs, batch_size, cancel=None):
+    """
+    Fatia as três agregações em blocos de `batch_size` produtos, em ordem de produto.
+
+    Gera (início, total de produtos, [compras, vendas, estoque] do bloco),
+    consultando `cancel` antes de cada bloco.
+    """
+    with perf.stage('prepare'):
+        # Um único factorize ordenado dá o código de produto das três agregações
+        todos, produtos = pd.factorize(np.concatenate([a['produto'].to_numpy() for a in aggs]), sort=True)
+        logger.info(f"Produtos encontrados: {len(produtos)}")
+
+        # Ordena cada agregação pelo código do produto para fatiar os blocos por busca binária
+        ordenados = []
+        for a, codes in zip(aggs, np.split(todos, np.cumsum([len(a) for a in aggs])[:-1])):
+            ordem = np.argsort(codes, kind='stable')
+            ordenados.append((a.iloc[ordem].reset_index(drop=True), codes[ordem]))
+
+    for inicio in range(0, len(produtos), batch_size):
+        _check_cancel(cancel)
+        partes = []
+        for a, codes in ordenados:
+            lo, hi = np.searchsorted(codes, [inicio, inicio + batch_size])
+            partes.append(a.iloc[lo:hi])
+        yield inicio, len(produtos), partes
+
+def _shard_of(produtos, n_shards):
+    """Shard estável de cada produto (mesmo valor -> mesmo shard em qualquer processo)."""
+    codes, uniques = pd.factorize(produtos)
+    hashes = pd.util.hash_pandas_object(pd.Series(uniques), index=False).to_numpy()
+    return (hashes % np.uint64(n_shards)).astype(np.int64)[codes]
+
+def _split_shards(agg, n_shards):
+    """Divide uma agregação em `n_shards` fatias pelo hash do produto."""
+    shard = _shard_of(agg['produto'], n_shards)
+    ordem = np.argsort(shard, kind='stable')
+    limites = np.searchsorted(shard[ordem], np.arange(n_shards + 1))
+    agg = agg.iloc[ordem]
+    return [agg.iloc[limites[i]:limites[i + 1]] for i in range(n_shards)]
+
+def reconcile_parallel(compras_agg, vendas_agg, estoque_agg, tolerance=0, engine='vectorized',
+                       workers=None, shards=None, progress=None, cancel=None):
+    """
+    Reconcilia em paralelo, com um `ProcessPoolExecutor` de `workers` processos.
+
+    Os produtos são distribuídos em `shards` fatias por hash (padrão: 4 por
+    worker, para equilibrar a carga) e cada worker recebe só as linhas dos
+    seus produtos. Os relatórios parciais são unidos e reordenados por
+    produto/data, resultando no mesmo relatório da execução serial.
+    Aqui `progress` conta shards concluídos, e `cancel` descarta os pendentes.
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Motor desconhecido '{engine}'. Opções: {', '.join(ENGINES)}")
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers * 4
+    partes = [_split_shards(a, shards) for a in (compras_agg, vendas_agg, estoque_agg)]
+
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futures = [ex.submit(reconcile_aggregated, c, v, e, tolerance, engine)
+                   for c, v, e in zip(*partes) if len(c) or len(v) or len(e)]
+        reports = []
+        try:
+            for f in as_completed(futures):
+                _check_cancel(cancel)
+                reports.append(f.result())
+                if progress is not None:
+                    progress(len(reports), len(futures))
+        except ReconciliationCancelled:
+            ex.shutdown(wait=False, cancel_futures=True)
+            raise
+
+    reports = [r for r in reports if not r.empty]
+    if not reports:
+        return pd.DataFrame()
+    return pd.concat(reports, ignore_index=True).sort_values(['produto','data']).reset_index(drop=True)
+
+def reconcile_grouped(compras_agg, vendas_agg, estoque_agg, keys, tolerance=0, engine='vectorized', workers=None,
+                      progress=None, cancel=None):
+    """
+    Reconcilia agregações com chave composta (ex.: loja, deposito, produto) em uma só passada.
+
+    Cada combinação de `keys` é uma cadeia de estoque independente; com
+    `workers` > 1 os grupos são distribuídos entre processos (ver
+    `reconcile_parallel`). O relatório tem as colunas `keys` seguidas de data,
+    estoques etc., ordenado por chave/data.
+    """
+    with perf.stage('encode_keys'):
+        aggs, chaves = encode_keys(compras_agg, vendas_agg, estoque_agg, keys)
+    perf.count('groups', len(chaves))
+    if workers is not None and workers > 1:
+        with perf.stage('reconcile', rows_in=sum(len(a) for a in aggs)) as st:
+            report = reconcile_parallel(*aggs, tolerance=tolerance, engine=engine, workers=workers,
+                                        progress=progress, cancel=cancel)
+            st.count('rows_out', len(report))
+    else:
+        report = reconcile_aggregated(*aggs, tolerance=tolerance, engine=engine, progress=progress, cancel=cancel)
+    with perf.stage('decode_keys'):
+        return decode_keys(report, chaves)
+
+def summarize_groups(report, by):
+    """
+    Resumo do relatório por `by` (ex.: ['loja']): total de discrepâncias,
+    contagem por tipo, itens (demais chaves) afetados e soma de |diferença|.
+    """
+    by = list(by)
+    colunas = [*by, 'discrepancias', *TIPOS, 'itens_afetados', 'diferenca_absoluta']
+    if report.empty:
+        return pd.DataFrame(columns=colunas)
+    chaves = list(report.columns[:report.columns.get_loc('data')])
+    outras = [k for k in chaves if k not in by]
+    por_tipo = report.groupby([*by, 'tipo_discrepancia'], observed=True).size().unstack(fill_value=0)
+    resumo = por_tipo.reindex(columns=TIPOS, fill_value=0)
+    resumo.columns = list(TIPOS)
+    resumo.insert(0, 'discrepancias', resumo.sum(axis=1))
+    grupos = report.groupby(by, observed=True)
+    resumo['itens_afetados'] = (report[chaves].drop_duplicates().groupby(by, observed=True).size()
+                                if outras else grupos.size().clip(upper=1))
+    resumo['diferenca_absoluta'] = report['diferenca'].abs().groupby([report[k] for k in by], observed=True).sum()
+    return resumo.reset_index()[colunas]
+
 # Função auxiliar: dados de exemplo (para uso pela UI)
 def get_example_data():
     compras_ex = pd.DataFrame([
@@ -169,4 +754,4 @@ if __name__ == "__main__":
     # Exemplo de execução direta do módulo
     c, v, e = get_example_data()
     rpt = detect_discrepancies(c, v, e, tolerance=2)
-    print(rpt)
+    print(render_report(rpt))
@@ -0,0 +1,79 @@
+# export.py
+"""
+Exportação do relatório (ou de um recorte filtrado) direto do DataFrame.
+
+As linhas a exportar são dadas por posições ou por uma máscara booleana
+sobre o relatório, e gravadas em blocos: CSV (opcionalmente .gz/.bz2/.xz)
+ou Parquet. As colunas de estoque continuam inteiros anuláveis (vazio no
+CSV, nulo no Parquet) e a sugestão sai com o texto completo.
+"""
+import os
+import numpy as np
+import logging
+from core import _check_cancel
+from streaming import CSV_COMPRESSIONS, write_report_parquet, write_report_stream
+
+logger = logging.getLogger("export")
+
+# Linhas por bloco gravado
+EXPORT_CHUNKSIZE = 200_000
+
+def output_format(path):
+    """'parquet' ou 'csv', pela extensão (ignorando a de compressão: relatorio.csv.gz -> 'csv')."""
+    base, ext = os.path.splitext(path.lower())
+    if ext in CSV_COMPRESSIONS:
+        ext = os.path.splitext(base)[1]
+    return 'parquet' if ext == '.parquet' else 'csv'
+
+def report_writer(path):
+    """Gravador em blocos (`write_report_parquet` ou `write_report_stream`) adequado a `path`."""
+    return write_report_parquet if output_format(path) == 'parquet' else write_report_stream
+
+def iter_rows(report, rows=None, chunksize=EXPORT_CHUNKSIZE):
+    """
+    Blocos de `report` restritos a `rows`: None (todas), máscara booleana
+    ou posições (ex.: as linhas visíveis após um filtro).
+    """
+    if rows is None:
+        rows = np.arange(len(report))
+    else:
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+    for inicio in range(0, len(rows), chunksize):
+        yield report.iloc[rows[inicio:inicio + chunksize]]
+
+def export_report(report, path, rows=None, chunksize=EXPORT_CHUNKSIZE, compression=None, progress=None, cancel=None):
+    """
+    Grava as linhas `rows` do relatório em `path` (CSV ou Parquet, pela extensão).
+
+    `compression` é repassada ao gravador (CSV: inferida pela extensão;
+    Parquet: 'snappy' por padrão). `progress(feitas, total)` recebe o avanço
+    em linhas e `cancel()`, se retornar True, interrompe com
+    `ReconciliationCancelled` (o arquivo parcial é removido).
+    Retorna o número de linhas gravadas.
+    """
+    total = len(report) if rows is None else int(np.count_nonzero(rows) if np.asarray(rows).dtype == bool else len(rows))
+
+    def blocos():
+        feitas = 0
+        for chunk in iter_rows(report, rows, chunksize):
+            _check_cancel(cancel)
+            yield chunk
+            feitas += len(chunk)
+            if progress is not None:
+                progress(feitas, total)
+
+    writer = report_writer(path)
+    kwargs = {} if compression is None else {'compression': compression}
+    if 'data' in report.columns:
+        # Relatório por chave composta (ex.: loja, produto): as colunas antes de `data`
+        kwargs['keys'] = list(report.columns[:report.columns.get_loc('data')])
+    try:
+        n = writer(blocos(), path, **kwargs)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    logger.info(f"Exportado: {path} ({n} linhas)")
+    return n
@@ -0,0 +1,119 @@
+# incremental.py
+import os
+import logging
+from dataclasses import dataclass, field
+import pandas as pd
+from core import _ensure_df, _aggregate_movements, _build_chains, _classify_chains
+
+logger = logging.getLogger("incremental")
+
+MOVEMENT_COLUMNS = ['produto','data','quantidade_comprada','quantidade_vendida','quantidade_em_estoque']
+# No diário, só as quantidades podem ficar vazias (lacunas do outer join)
+_JOURNAL_NA = {col: [''] for col in MOVEMENT_COLUMNS[2:]}
+
+@dataclass
+class IncrementalResult:
+    report: pd.DataFrame
+    # Produtos recalculados do zero (linhas atrasadas): suas linhas anteriores devem ser substituídas
+    recomputed: list = field(default_factory=list)
+
+def _movements(compras_agg, vendas_agg, estoque_agg):
+    """Une as três agregações em um frame de movimentos (produto, data)."""
+    keys = ['produto','data']
+    mov = compras_agg.merge(vendas_agg, on=keys, how='outer').merge(estoque_agg, on=keys, how='outer')
+    return mov[MOVEMENT_COLUMNS]
+
+def _split(mov):
+    """Volta do frame de movimentos para as três agregações (sem as lacunas do outer join)."""
+    return [mov.loc[mov[col].notna(), ['produto','data',col]] for col in MOVEMENT_COLUMNS[2:]]
+
+class IncrementalReconciler:
+    """
+    Reconciliação incremental (append-only) com estado persistido em `state_dir`.
+
+    - checkpoint.csv: última data reconciliada e último estoque de cada produto,
+      o único estado que a cadeia de um produto carrega de um dia para o outro;
+    - movimentos.csv: diário append-only dos movimentos agregados, lido apenas
+      para recalcular produtos que recebem linhas com datas já reconciliadas.
+    """
+
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+        self.checkpoint_path = os.path.join(state_dir, 'checkpoint.csv')
+        self.journal_path = os.path.join(state_dir, 'movimentos.csv')
+
+    def load_checkpoint(self):
+        """Checkpoint indexado por produto com `ultima_data` e `ultimo_estoque`."""
+        if not os.path.exists(self.checkpoint_path):
+            return pd.DataFrame({
+                'ultima_data': pd.Series(dtype='datetime64[ns]'),
+                'ultimo_estoque': pd.Series(dtype='Int64'),
+            }, index=pd.Index([], name='produto'))
+        # produto sempre como texto: SKUs como '001' não podem virar o inteiro 1
+        cp = pd.read_csv(self.checkpoint_path, parse_dates=['ultima_data'],
+                         dtype={'produto': str, 'ultimo_estoque': 'Int64'}, keep_default_na=False, na_values={'ultimo_estoque': ['']})
+        return cp.set_index('produto')
+
+    def _save_checkpoint(self, cp, chains):
+        ultima = chains.groupby('produto')['data'].max()
+        ultimo = chains[chains['tem_atual']].groupby('produto')['estoque_atual'].last()
+        novo = pd.DataFrame({'ultima_data': ultima, 'ultimo_estoque': ultimo.reindex(ultima.index).astype('Int64')})
+        cp = novo.combine_first(cp)
+        cp.index.name = 'produto'
+        tmp = self.checkpoint_path + '.tmp'
+        cp.reset_index().to_csv(tmp, index=False)
+        os.replace(tmp, self.checkpoint_path)
+
+    def _read_journal(self, produtos, chunksize=500_000):
+        """Movimentos já registrados dos `produtos` informados (leitura em blocos)."""
+        if not os.path.exists(self.journal_path):
+            return pd.DataFrame(columns=MOVEMENT_COLUMNS)
+        partes = [chunk[chunk['produto'].isin(produtos)]
+                  for chunk in pd.read_csv(self.journal_path, parse_dates=['data'], chunksize=chunksize,
+                                           dtype={'produto': str}, keep_default_na=False, na_values=_JOURNAL_NA)]
+        return pd.concat(partes, ignore_index=True)
+
+    def _append_journal(self, mov):
+        header = not os.path.exists(self.journal_path)
+        mov.to_csv(self.journal_path, mode='a', header=header, index=False)
+
+    def update(self, compras_df=None, vendas_df=None, estoque_df=None, tolerance=0):
+        """
+        Reconcilia apenas as linhas novas e atualiza o estado.
+
+        Produtos cujas linhas novas começam depois da `ultima_data` do
+        checkpoint continuam a cadeia a partir do `ultimo_estoque`. Produtos
+        com linhas atrasadas (data <= `ultima_data`) são recalculados com o
+        histórico do diário e listados em `recomputed`.
+        """
+        compras = _ensure_df(compras_df, ['data','produto','quantidade_comprada'])
+        vendas = _ensure_df(vendas_df, ['data','produto','quantidade_vendida'])
+        estoque = _ensure_df(estoque_df, ['data','produto','quantidade_em_estoque'])
+        mov = _movements(*_aggregate_movements(compras, vendas, estoque))
+        if mov.empty:
+            return IncrementalResult(pd.DataFrame())
+
+        cp = self.load_checkpoint()
+        primeira = mov.groupby('produto')['data'].min()
+        ultima = cp['ultima_data'].reindex(primeira.index)
+        atrasados = primeira.index[(primeira <= ultima).to_numpy()].tolist()
+        is_late = mov['produto'].isin(atrasados)
+
+        chains = [_build_chains(*_split(mov[~is_late]), seed=cp['ultimo_estoque'].dropna())]
+        if atrasados:
+            logger.info(f"Recalculando {len(atrasados)} produtos com linhas atrasadas")
+            hist = self._read_journal(atrasados)
+            full = (pd.concat([hist, mov[is_late]], ignore_index=True)
+                      .groupby(['produto','data'], as_index=False).sum(min_count=1))
+            chains.append(_build_chains(*_split(full)))
+
+        reports = [r for r in (_classify_chains(ch, tolerance) for ch in chains) if not r.empty]
+        if reports:
+            report = pd.concat(reports, ignore_index=True).sort_values(['produto','data']).reset_index(drop=True)
+        else:
+            report = pd.DataFrame()
+
+        self._append_journal(mov)
+        self._save_checkpoint(cp, pd.concat(chains, ignore_index=True))
+        return IncrementalResult(report, sorted(atrasados))
@@ -0,0 +1,134 @@
+# loaders.py
+"""
+Ingestão tipada das entradas (compras, vendas, estoque).
+
+Só as colunas data/produto/quantidade são lidas, e já com tipos compactos:
+produto categórico, quantidade int32 (int64/float64 só quando os valores
+exigem) e data convertida por um formato fixo, com a conversão genérica
+apenas nas linhas que não seguem o formato. Linhas que não puderem ser
+convertidas são descartadas e devolvidas à parte, com o número da linha.
+"""
+import os
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+import logging
+from core import DEFAULT_KEYS
+
+logger = logging.getLogger("loaders")
+
+DATE_FORMAT = '%Y-%m-%d'
+DEFAULT_CHUNKSIZE = 500_000
+
+# Colunas do relatório de linhas rejeitadas
+ERROR_COLUMNS = ['linha', 'coluna', 'valor', 'motivo']
+
+@dataclass
+class LoadResult:
+    frame: pd.DataFrame
+    # Linhas descartadas: linha (no arquivo, cabeçalho = 1), coluna, valor e motivo
+    errors: pd.DataFrame
+
+def _empty_errors():
+    return pd.DataFrame({c: pd.Series(dtype=object if c != 'linha' else np.int64) for c in ERROR_COLUMNS})
+
+def _rejected(linhas, coluna, valores, mask, motivo):
+    if not mask.any():
+        return None
+    return pd.DataFrame({
+        'linha': linhas[mask],
+        'coluna': coluna,
+        'valor': valores.to_numpy(dtype=object)[mask],
+        'motivo': motivo,
+    })
+
+def _downcast(values):
+    """int32 quando os valores são inteiros e cabem; senão int64 ou float64."""
+    if not len(values):
+        return values.astype(np.int32)
+    if np.array_equal(values, np.trunc(values)):
+        lo, hi = values.min(), values.max()
+        if np.iinfo(np.int32).min <= lo and hi <= np.iinfo(np.int32).max:
+            return values.astype(np.int32)
+        return values.astype(np.int64)
+    return values
+
+def parse_dates(values, date_format=DATE_FORMAT):
+    """Converte datas pelo formato fixo; só as linhas fora do formato passam pela conversão genérica."""
+    datas = pd.to_datetime(values, format=date_format, errors='coerce')
+    fora = datas.isna() & values.notna()
+    if fora.any():
+        datas[fora] = pd.to_datetime(values[fora], format='mixed', errors='coerce')
+    return datas
+
+def normalize_frame(df, qty_col, date_format=DATE_FORMAT, first_line=2, keys=DEFAULT_KEYS):
+    """
+    Converte um bloco lido como texto para data/chaves (`keys`)/`qty_col` tipados.
+
+    Quantidade vazia conta como 0; data ou chave ausentes, data fora de
+    qualquer formato reconhecido e quantidade não numérica rejeitam a linha.
+    `first_line` é o número, no arquivo, da primeira linha do bloco.
+    """
+    linhas = np.arange(first_line, first_line + len(df))
+    rejeitada = np.zeros(len(df), dtype=bool)
+    erros = []
+
+    bruto = df['data'] if 'data' in df else pd.Series(pd.NA, index=df.index, dtype=object)
+    data = parse_dates(bruto, date_format)
+    ruim = data.isna().to_numpy()
+    erros.append(_rejected(linhas, 'data', bruto, ruim, 'data ausente ou inválida'))
+    rejeitada |= ruim
+
+    chaves = {}
+    for k in keys:
+        chaves[k] = df[k] if k in df else pd.Series(pd.NA, index=df.index, dtype=object)
+        ruim = chaves[k].isna().to_numpy()
+        erros.append(_rejected(linhas, k, chaves[k], ruim, f'{k} ausente'))
+        rejeitada |= ruim
+
+    if qty_col in df:
+        qtd = df[qty_col]
+        if not pd.api.types.is_numeric_dtype(qtd):
+            # O leitor só devolve texto quando há valores não numéricos no bloco
+            numerico = pd.to_numeric(qtd, errors='coerce')
+            ruim = (numerico.isna() & qtd.notna()).to_numpy()
+            erros.append(_rejected(linhas, qty_col, qtd, ruim, 'quantidade não numérica'))
+            rejeitada |= ruim
+            qtd = numerico
+        qtd = qtd.to_numpy(dtype='float64', na_value=0.0)
+    else:
+        qtd = np.zeros(len(df))
+
+    ok = ~rejeitada
+    frame = pd.DataFrame({
+        'data': data.to_numpy()[ok],
+        **{k: v.astype('category').array[ok].remove_unused_categories() for k, v in chaves.items()},
+        qty_col: _downcast(qtd[ok]),
+    })
+    erros = [e for e in erros if e is not None]
+    errors = pd.concat(erros, ignore_index=True).sort_values('linha', kind='stable') if erros else _empty_errors()
+    return LoadResult(frame, errors.reset_index(drop=True))
+
+def open_csv(path, qty_col, chunksize=DEFAULT_CHUNKSIZE, keys=DEFAULT_KEYS):
+    """
+    Leitor em blocos só das colunas data/`keys`/`qty_col` (data como texto, chaves já categóricas).
+
+    O cabeçalho é conferido antes: sem alguma dessas colunas (ex.: arquivo
+    separado por ';') levanta ValueError, em vez de ler zero linhas.
+    """
+    cols = ['data', *keys, qty_col]
+    cabecalho = list(pd.read_csv(path, nrows=0).columns)
+    faltando = [c for c in cols if c not in cabecalho]
+    if faltando:
+        raise ValueError(f"{os.path.basename(path)}: coluna(s) {', '.join(map(repr, faltando))} não encontrada(s) "
+                         f"(cabeçalho lido: {', '.join(map(str, cabecalho)) or 'vazio'})")
+    return pd.read_csv(path, usecols=lambda c: c in cols, dtype={'data': str, **{k: 'category' for k in keys}},
+                       chunksize=chunksize)
+
+def format_errors(errors, path=None, limit=5):
+    """Resumo legível das linhas rejeitadas (as `limit` primeiras)."""
+    nome = f"{os.path.basename(path)}: " if path else ""
+    linhas = errors['linha'].nunique()
+    exemplos = [f"linha {r.linha}: {r.coluna}={r.valor!r} ({r.motivo})" for r in errors.head(limit).itertuples()]
+    resto = f"; ... (+{len(errors) - limit})" if len(errors) > limit else ""
+    return f"{nome}{linhas} linha(s) ignorada(s): " + "; ".join(exemplos) + resto
@@ -1,7 +1,10 @@
 # main.py
+import logging
 from ui import StockValidatorApp
 
 def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    # A janela aparece logo; pandas e o motor são carregados em segundo plano (ver ui._load_backend)
     app = StockValidatorApp()
     app.mainloop()
 
@@ -0,0 +1,241 @@
+# perf.py
+"""
+Instrumentação leve das etapas do pipeline (desligada por padrão).
+
+Os pontos instrumentados chamam `stage(nome)` e `count(contador, n)`;
+sem um `Recorder` ativo essas chamadas não fazem nada. Com um ativo:
+
+    rec = Recorder(memory=True, profile=True)
+    with rec:
+        detect_discrepancies(...)
+    rec.to_dict()          # etapas, tempos, linhas, produtos/s, pico de memória, perfil
+    rec.dump_profile('execucao.prof')
+
+Etapas abertas dentro de outras ficam com o nome composto ('reconcile/chains');
+o aninhamento é acompanhado por thread, então uma etapa da thread da
+interface não se mistura às da thread de trabalho. Uma etapa executada
+várias vezes (ex.: por bloco) acumula tempo e contadores.
+"""
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+import tracemalloc
+import logging
+
+logger = logging.getLogger("perf")
+
+try:
+    import resource
+except ImportError:          # Windows: sem pico de RSS
+    resource = None
+
+# Recorder ativo (um por vez, compartilhado entre threads; cada thread tem sua pilha de etapas)
+_active = None
+
+def _rss_max_mb():
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(kb / 1024, 1)
+
+class _NullStage:
+    """Etapa sem efeito, devolvida quando não há instrumentação ativa."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def count(self, name, n):
+        pass
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    def __init__(self, recorder, name, counters):
+        self.recorder, self.name, self.initial = recorder, name, counters
+        self.key = None
+
+    def __enter__(self):
+        self.key, self.t0 = self.recorder._enter(self.name), time.perf_counter()
+        for k, n in self.initial.items():
+            self.count(k, n)
+        return self
+
+    def __exit__(self, *exc):
+        self.recorder._exit(self.key, time.perf_counter() - self.t0)
+        return False
+
+    def count(self, name, n):
+        self.recorder._count(self.key, name, n)
+
+class Recorder:
+    """
+    Coleta tempo de parede, chamadas e contadores (linhas, produtos...) por etapa.
+
+    `memory=True` mede o pico de memória de cada etapa com tracemalloc (que
+    deixa a execução sensivelmente mais lenta); `profile=True` captura um
+    perfil cProfile enquanto o recorder estiver ativo.
+    """
+
+    def __init__(self, memory=False, profile=False):
+        self.memory = memory
+        self.profiler = cProfile.Profile() if profile else None
+        self.stages = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracing = False
+
+    def __enter__(self):
+        global _active
+        if _active is not None and _active is not self:
+            raise RuntimeError("Já existe uma instrumentação ativa")
+        _active = self
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        if self.profiler is not None:
+            self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        if self.profiler is not None:
+            self.profiler.disable()
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+        _active = None
+        return False
+
+    def stage(self, name, **counters):
+        return _Stage(self, name, counters)
+
+    def _frames(self):
+        """Pilha de etapas abertas e picos de memória das etapas internas, da thread atual."""
+        local = self._local
+        if not hasattr(local, 'stack'):
+            local.stack, local.child_peak = [], []
+        return local.stack, local.child_peak
+
+    def _enter(self, name):
+        stack, child_peak = self._frames()
+        with self._lock:
+            stack.append(name)
+            key = '/'.join(stack)
+            entry = self.stages.setdefault(key, {'calls': 0, 'seconds': 0.0, 'counters': {}})
+            entry['calls'] += 1
+            if self.memory and tracemalloc.is_tracing():
+                # O pico da etapa externa até aqui é preservado antes de zerar para a interna
+                if child_peak:
+                    child_peak[-1] = max(child_peak[-1], tracemalloc.get_traced_memory()[1])
+                tracemalloc.reset_peak()
+            child_peak.append(0)
+            return key
+
+    def _exit(self, key, seconds):
+        stack, child_peak = self._frames()
+        with self._lock:
+            entry = self.stages[key]
+            entry['seconds'] += seconds
+            pico = child_peak.pop()
+            if self.memory and tracemalloc.is_tracing():
+                pico = max(pico, tracemalloc.get_traced_memory()[1])
+                entry['peak_mb'] = max(entry.get('peak_mb', 0.0), pico / 2**20)
+                if child_peak:
+                    child_peak[-1] = max(child_peak[-1], pico)
+            stack.pop()
+
+    def _count(self, key, name, n):
+        with self._lock:
+            counters = self.stages[key]['counters']
+            counters[name] = counters.get(name, 0) + int(n)
+
+    def _count_current(self, name, n):
+        stack = self._frames()[0]
+        if stack:
+            self._count('/'.join(stack), name, n)
+
+    def exclusive_seconds(self, names):
+        """
+        Segundos de cada etapa de `names`, somados em qualquer nível de aninhamento
+        e sem o tempo das etapas de `names` abertas dentro dela (ex.: com
+        names=['write', 'reconcile'], 'write/reconcile' conta só em 'reconcile').
+        """
+        seconds = dict.fromkeys(names, 0.0)
+        for key, e in self.stages.items():
+            partes = key.split('/')
+            if partes[-1] not in seconds:
+                continue
+            seconds[partes[-1]] += e['seconds']
+            externa = next((p for p in reversed(partes[:-1]) if p in seconds), None)
+            if externa is not None:
+                seconds[externa] -= e['seconds']
+        return seconds
+
+    def to_dict(self, profile_limit=25):
+        """Resultado estruturado (serializável em JSON)."""
+        etapas = []
+        for key, e in self.stages.items():
+            item = {'stage': key, 'calls': e['calls'], 'seconds': round(e['seconds'], 6), **e['counters']}
+            if 'products' in e['counters'] and e['seconds'] > 0:
+                item['products_per_s'] = round(e['counters']['products'] / e['seconds'], 1)
+            if 'peak_mb' in e:
+                item['peak_mb'] = round(e['peak_mb'], 3)
+            etapas.append(item)
+        result = {'stages': etapas, 'rss_max_mb': _rss_max_mb()}
+        if self.profiler is not None:
+            result['profile'] = self.profile_stats(profile_limit)
+        return result
+
+    def to_json(self, path=None, **kwargs):
+        texto = json.dumps(self.to_dict(**kwargs), indent=2, ensure_ascii=False)
+        if path is not None:
+            with open(path, 'w', encoding='utf-8') as fh:
+                fh.write(texto)
+        return texto
+
+    def profile_stats(self, limit=25):
+        """As `limit` funções com maior tempo acumulado no perfil."""
+        if self.profiler is None:
+            return []
+        st = pstats.Stats(self.profiler, stream=io.StringIO())
+        linhas = []
+        for (arquivo, linha, funcao), (_, ncalls, tottime, cumtime, _) in st.stats.items():
+            linhas.append({'function': f"{arquivo}:{linha}({funcao})", 'calls': ncalls,
+                           'tottime': round(tottime, 6), 'cumtime': round(cumtime, 6)})
+        linhas.sort(key=lambda l: l['cumtime'], reverse=True)
+        return linhas[:limit]
+
+    def dump_profile(self, path):
+        """Grava o perfil no formato do pstats (para snakeviz, `python -m pstats` etc.)."""
+        if self.profiler is None:
+            raise ValueError("Perfil não capturado (use Recorder(profile=True))")
+        self.profiler.dump_stats(path)
+
+    def format(self):
+        """Tabela de texto com as etapas (para logs e para o painel de diagnóstico)."""
+        linhas = [f"{'etapa':<32} {'s':>9} {'chamadas':>8} {'linhas in':>10} {'linhas out':>10} {'produtos/s':>11} {'pico MB':>8}"]
+        for e in self.to_dict(profile_limit=0)['stages']:
+            def campo(k, fmt):
+                return format(e[k], fmt) if k in e else '-'
+            linhas.append(f"{e['stage']:<32} {e['seconds']:9.3f} {e['calls']:8d} {campo('rows_in', 'd'):>10} "
+                          f"{campo('rows_out', 'd'):>10} {campo('products_per_s', '.0f'):>11} {campo('peak_mb', '.1f'):>8}")
+        return "\n".join(linhas)
+
+def stage(name, **counters):
+    """Etapa instrumentada (contexto); sem efeito quando não há `Recorder` ativo."""
+    rec = _active
+    if rec is None:
+        return _NULL_STAGE
+    return rec.stage(name, **counters)
+
+def count(name, n):
+    """Soma `n` ao contador `name` da etapa aberta mais interna."""
+    rec = _active
+    if rec is not None:
+        rec._count_current(name, n)
@@ -0,0 +1,73 @@
+# search.py
+import numpy as np
+import pandas as pd
+
+from core import factorize_sugestao
+
+# Colunas consultadas pela busca rápida (mesmas da UI: produto / sugestão / tipo)
+SEARCH_COLUMNS = ('produto', 'sugestao', 'tipo_discrepancia')
+
+class ReportIndex:
+    """
+    Índice de busca de um relatório de discrepâncias, montado uma vez por relatório.
+
+    Cada coluna pesquisável vira códigos categóricos (int por linha) + valores
+    distintos já em minúsculas. Uma busca testa o texto apenas nos valores
+    distintos e projeta o resultado nas linhas pelos códigos, com operações
+    vetorizadas; filtros por produto/tipo comparam só códigos. A última
+    busca de cada coluna é guardada para que digitar mais letras só refine
+    os valores que já casavam.
+
+    O índice é montado inteiro na criação (na thread que gera o relatório), para
+    que a primeira busca não pague a indexação; a coluna de sugestões formata
+    apenas as combinações distintas de modelo e números (ver `factorize_sugestao`).
+    """
+
+    def __init__(self, report):
+        self.size = len(report)
+        self._cols = {}
+        for col in SEARCH_COLUMNS:
+            if col not in report:
+                continue
+            if col == 'sugestao':
+                codes, uniques = factorize_sugestao(report)
+            else:
+                codes, uniques = pd.factorize(report[col])
+            lowered = pd.Series(uniques, dtype=object).astype(str).str.lower()
+            self._cols[col] = (codes, pd.Index(uniques), lowered)
+        self._last = {}
+
+    def _code_of(self, col, value):
+        """Código categórico de `value` na coluna (-1 se o valor não existe)."""
+        return self._cols[col][1].get_indexer([value])[0]
+
+    def _match_uniques(self, col, q):
+        """Máscara sobre os valores distintos (+1 posição falsa para o código -1 de nulos)."""
+        _, _, lowered = self._cols[col]
+        prev = self._last.get(col)
+        if prev is not None and q.startswith(prev[0]):
+            candidatos = np.flatnonzero(prev[1][:-1])
+        else:
+            candidatos = np.arange(len(lowered))
+        match = np.zeros(len(lowered) + 1, dtype=bool)
+        match[candidatos] = lowered.iloc[candidatos].str.contains(q, regex=False).to_numpy(dtype=bool)
+        self._last[col] = (q, match)
+        return match
+
+    def mask(self, text='', produto=None, tipo=None):
+        """Máscara booleana das linhas que atendem aos filtros e contêm `text` em alguma coluna."""
+        mask = np.ones(self.size, dtype=bool)
+        for col, value in (('produto', produto), ('tipo_discrepancia', tipo)):
+            if value is not None and col in self._cols:
+                code = self._code_of(col, value)
+                mask &= (self._cols[col][0] == code) if code >= 0 else False
+        q = (text or '').strip().lower()
+        if q:
+            hit = np.zeros(self.size, dtype=bool)
+            for col, (codes, _, _) in self._cols.items():
+                hit |= self._match_uniques(col, q)[codes]
+            mask &= hit
+        return mask
+
+    def positions(self, text='', produto=None, tipo=None):
+        return np.flatnonzero(self.mask(text, produto, tipo))
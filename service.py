@@ -0,0 +1,444 @@
+# service.py
+"""
+Serviço HTTP local (asyncio, só biblioteca padrão) de reconciliação.
+
+Outras ferramentas pedem relatórios sem abrir a interface e sem pagar a
+importação do pandas a cada chamada: os processos de trabalho são criados
+e aquecidos (pandas/core importados) na partida, e cada um guarda as
+cadeias já montadas (`core.PreparedChains`) das entradas usadas há pouco,
+então repetir um pedido com outra tolerância só reclassifica. Pedidos com
+as mesmas entradas vão para o mesmo processo.
+
+    python service.py --port 8765 --workers 2
+
+    POST /uploads?ext=csv      corpo = arquivo; devolve {"upload": nome}
+    POST /jobs                 {"compras": caminho | {"upload": nome}, "vendas": ..., "estoque": ...,
+                                "tolerance": 0, "keys": ["produto"], "format": "csv" | "csv.gz" | "parquet"}
+    GET  /jobs, /jobs/<id>     estado (queued, running, done, failed, cancelled)
+    GET  /jobs/<id>/result     relatório, enviado em blocos (chunked)
+    DELETE /jobs/<id>          cancela (se ainda na fila) e descarta o resultado
+    POST /reconcile            como /jobs, mas espera e já devolve o relatório
+    GET  /health
+
+O processo do servidor não importa o pandas; só os de trabalho.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from urllib.parse import parse_qs, urlsplit
+
+logger = logging.getLogger("service")
+
+DEFAULT_PORT = 8765
+DEFAULT_SPOOL_DIR = os.path.join(tempfile.gettempdir(), 'consistencia-servico')
+# Entradas (cadeias montadas) mantidas em memória por processo de trabalho
+HOT_INPUTS = 4
+# Jobs terminados guardados (com o resultado em disco) antes de descartar os mais antigos
+MAX_JOBS = 100
+MAX_JSON_BYTES = 1024 * 1024
+STREAM_BLOCK = 256 * 1024
+
+FORMATS = {'csv': 'text/csv; charset=utf-8', 'csv.gz': 'application/gzip', 'parquet': 'application/vnd.apache.parquet'}
+UPLOAD_EXTENSIONS = ('csv', 'xlsx', 'xlsm')
+_UPLOAD_NAME = re.compile(r'^[0-9a-f]{64}\.(csv|xlsx|xlsm)$')
+
+# Processos de trabalho
+# Estado de cada processo do pool (preenchido por `_warm`)
+_hot = OrderedDict()
+_hot_max = HOT_INPUTS
+_input_cache = None
+
+def _warm(cache_dir=None, hot_inputs=HOT_INPUTS):
+    """Inicializador dos processos: importa pandas/core uma única vez e prepara os caches."""
+    global _hot_max, _input_cache
+    import core, export, streaming  # noqa: F401
+    from cache import InputCache
+    _hot_max = hot_inputs
+    _input_cache = InputCache(cache_dir) if cache_dir else None
+
+def _ping():
+    return os.getpid()
+
+def _file_id(path):
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime_ns
+
+def _run_job(paths, tolerance, keys, output):
+    """Reconcilia `paths` (compras, vendas, estoque) e grava o relatório em `output`."""
+    from core import DEFAULT_KEYS, PreparedChains, decode_keys, encode_keys
+    from export import export_report
+    from streaming import load_aggregated
+
+    t0 = time.perf_counter()
+    chave = (tuple(_file_id(p) for p in paths), tuple(keys))
+    hit = chave in _hot
+    if hit:
+        _hot.move_to_end(chave)
+        prepared, chaves = _hot[chave]
+    else:
+        aggs = load_aggregated(*paths, cache=_input_cache, keys=keys)
+        chaves = None
+        if list(keys) != list(DEFAULT_KEYS):
+            aggs, chaves = encode_keys(*aggs, keys)
+        prepared = PreparedChains(*aggs)
+        _hot[chave] = (prepared, chaves)
+        while len(_hot) > _hot_max:
+            _hot.popitem(last=False)
+    report = prepared.reconcile(tolerance)
+    if chaves is not None:
+        report = decode_keys(report, chaves)
+    rows = export_report(report, output)
+    return {'rows': rows, 'counts': prepared.counts(tolerance), 'cache_hit': hit, 'worker': os.getpid(),
+            'seconds': round(time.perf_counter() - t0, 3)}
+
+# Servidor
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+_REASONS = {200: 'OK', 201: 'Created', 202: 'Accepted', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+class Job:
+    def __init__(self, spec, result_dir):
+        self.id = uuid.uuid4().hex[:12]
+        self.spec = spec
+        self.output = os.path.join(result_dir, f"{self.id}.{spec['format']}")
+        self.future = None
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.done = asyncio.Event()
+
+    def to_dict(self):
+        status = 'running' if self.status == 'queued' and self.future is not None and self.future.running() else self.status
+        d = {'id': self.id, 'status': status, 'tolerance': self.spec['tolerance'], 'keys': self.spec['keys'],
+             'format': self.spec['format'], 'created': self.created, 'finished': self.finished}
+        if self.result is not None:
+            d.update(self.result)
+        if self.error is not None:
+            d['error'] = self.error
+        return d
+
+class ReconciliationService:
+    """
+    Fila de jobs sobre `workers` processos aquecidos.
+
+    Cada processo é um `ProcessPoolExecutor` de um só trabalhador, para que
+    pedidos com as mesmas entradas caiam no processo que já tem as cadeias
+    em memória; entradas novas vão para o processo com menos jobs pendentes.
+    """
+
+    def __init__(self, workers=2, spool_dir=DEFAULT_SPOOL_DIR, cache_dir=None, hot_inputs=HOT_INPUTS):
+        self.workers = max(1, workers)
+        self.spool_dir = spool_dir
+        self.upload_dir = os.path.join(spool_dir, 'uploads')
+        self.result_dir = os.path.join(spool_dir, 'resultados')
+        os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(self.result_dir, exist_ok=True)
+        self._initargs = (cache_dir, hot_inputs)
+        self.pools = [self._new_pool() for _ in range(self.workers)]
+        self.pending = [0] * self.workers
+        # Entradas -> processo que as tem em memória (espelho aproximado dos caches dos processos)
+        self.homes = OrderedDict()
+        self.hot_inputs = hot_inputs
+        self.jobs = OrderedDict()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=1, initializer=_warm, initargs=self._initargs)
+
+    async def warm_up(self):
+        """Cria e aquece todos os processos antes de aceitar pedidos."""
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*(loop.run_in_executor(p, _ping) for p in self.pools))
+        logger.info(f"{len(pids)} processo(s) de trabalho prontos: {', '.join(map(str, pids))}")
+
+    def close(self):
+        for p in self.pools:
+            p.shutdown(wait=False, cancel_futures=True)
+
+    # Jobs
+    def _resolve(self, ref, nome):
+        if isinstance(ref, dict) and 'upload' in ref:
+            if not _UPLOAD_NAME.match(str(ref['upload'])):
+                raise HTTPError(400, f"{nome}: upload inválido")
+            path = os.path.join(self.upload_dir, ref['upload'])
+        elif isinstance(ref, str):
+            path = ref
+        else:
+            raise HTTPError(400, f"{nome}: informe um caminho ou {{\"upload\": nome}}")
+        if not os.path.isfile(path):
+            raise HTTPError(400, f"{nome}: arquivo não encontrado: {path}")
+        return path
+
+    def parse_spec(self, body):
+        try:
+            spec = json.loads(body or b'{}')
+        except ValueError as e:
+            raise HTTPError(400, f"JSON inválido: {e}")
+        if not isinstance(spec, dict):
+            raise HTTPError(400, "O corpo deve ser um objeto JSON")
+        paths = [self._resolve(spec.get(n), n) for n in ('compras', 'vendas', 'estoque')]
+        tolerance = spec.get('tolerance', 0)
+        if not isinstance(tolerance, int) or isinstance(tolerance, bool):
+            raise HTTPError(400, "tolerance deve ser um inteiro")
+        keys = spec.get('keys', ['produto'])
+        if not (isinstance(keys, list) and keys and all(isinstance(k, str) for k in keys)):
+            raise HTTPError(400, "keys deve ser uma lista de colunas")
+        fmt = spec.get('format', 'csv')
+        if fmt not in FORMATS:
+            raise HTTPError(400, f"format deve ser um de: {', '.join(FORMATS)}")
+        return {'paths': paths, 'tolerance': tolerance, 'keys': keys, 'format': fmt}
+
+    def _choose_worker(self, chave):
+        if chave in self.homes:
+            self.homes.move_to_end(chave)
+            return self.homes[chave]
+        i = min(range(self.workers), key=lambda w: self.pending[w])
+        self.homes[chave] = i
+        while len(self.homes) > self.hot_inputs * self.workers:
+            self.homes.popitem(last=False)
+        return i
+
+    def submit(self, spec):
+        job = Job(spec, self.result_dir)
+        chave = (tuple(_file_id(p) for p in spec['paths']), tuple(spec['keys']))
+        i = self._choose_worker(chave)
+        self.pending[i] += 1
+        job.future = self.pools[i].submit(_run_job, spec['paths'], spec['tolerance'], spec['keys'], job.output)
+        self.jobs[job.id] = job
+        asyncio.get_running_loop().create_task(self._watch(job, i, self.pools[i]))
+        self._trim()
+        logger.info(f"Job {job.id} na fila do processo {i}")
+        return job
+
+    async def _watch(self, job, i, pool):
+        try:
+            job.result = await asyncio.wrap_future(job.future)
+            job.status = 'done'
+        except asyncio.CancelledError:
+            job.status = 'cancelled'
+        except BrokenProcessPool as e:
+            job.status, job.error = 'failed', f"Processo de trabalho encerrado: {e}"
+            # Recria o processo uma única vez (todos os jobs na fila dele falham juntos);
+            # as entradas dele deixam de estar quentes
+            if self.pools[i] is pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+                self.pools[i] = self._new_pool()
+                for k in [k for k, w in self.homes.items() if w == i]:
+                    del self.homes[k]
+        except Exception as e:
+            job.status, job.error = 'failed', f"{type(e).__name__}: {e}"
+        finally:
+            self.pending[i] -= 1
+            job.finished = time.time()
+            job.done.set()
+            if job.id not in self.jobs and os.path.exists(job.output):
+                os.remove(job.output)       # descartado enquanto rodava
+            logger.info(f"Job {job.id}: {job.status}" + (f" ({job.error})" if job.error else ""))
+
+    def _trim(self):
+        terminados = [j for j in self.jobs.values() if j.done.is_set()]
+        for job in terminados[:max(0, len(self.jobs) - MAX_JOBS)]:
+            self.discard(job)
+
+    def discard(self, job):
+        """Cancela o job se ainda estiver na fila e apaga o resultado."""
+        job.future.cancel()
+        self.jobs.pop(job.id, None)
+        if job.done.is_set() and os.path.exists(job.output):
+            os.remove(job.output)
+
+    def job(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise HTTPError(404, f"Job não encontrado: {job_id}")
+        return job
+
+    async def save_upload(self, reader, length, ext):
+        """Grava o corpo em disco em blocos; o nome é o SHA-256 do conteúdo (reenvios reaproveitam o cache)."""
+        if ext not in UPLOAD_EXTENSIONS:
+            raise HTTPError(400, f"ext deve ser um de: {', '.join(UPLOAD_EXTENSIONS)}")
+        h = hashlib.sha256()
+        fd, tmp = tempfile.mkstemp(dir=self.upload_dir, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as fh:
+                restante = length
+                while restante:
+                    bloco = await reader.read(min(STREAM_BLOCK, restante))
+                    if not bloco:
+                        raise HTTPError(400, "Corpo incompleto")
+                    h.update(bloco)
+                    fh.write(bloco)
+                    restante -= len(bloco)
+            nome = f"{h.hexdigest()}.{ext}"
+            destino = os.path.join(self.upload_dir, nome)
+            if os.path.exists(destino):
+                os.remove(tmp)      # mesmo conteúdo: mantém o arquivo (e o mtime) já em cache
+            else:
+                os.replace(tmp, destino)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        return nome
+
+    # HTTP
+    async def handle(self, reader, writer):
+        try:
+            try:
+                await self._dispatch(reader, writer)
+            except HTTPError as e:
+                await _send_json(writer, e.status, {'error': str(e)})
+            except (ConnectionError, asyncio.IncompleteReadError):
+                pass
+            except Exception as e:
+                logger.exception("Erro ao atender pedido")
+                await _send_json(writer, 500, {'error': f"{type(e).__name__}: {e}"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, reader, writer):
+        linha = await reader.readline()
+        if not linha:
+            return
+        try:
+            method, target, _ = linha.decode('latin-1').split()
+        except ValueError:
+            raise HTTPError(400, "Linha de pedido inválida")
+        headers = {}
+        while True:
+            h = await reader.readline()
+            if h in (b'\r\n', b'\n', b''):
+                break
+            nome, _, valor = h.decode('latin-1').partition(':')
+            headers[nome.strip().lower()] = valor.strip()
+        url = urlsplit(target)
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        partes = [p for p in url.path.split('/') if p]
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise HTTPError(400, "Content-Length inválido")
+
+        async def body():
+            if length > MAX_JSON_BYTES:
+                raise HTTPError(413, "Corpo JSON grande demais; envie os arquivos por /uploads")
+            return await reader.readexactly(length)
+
+        rota = (method, partes[0] if partes else '', len(partes))
+        if rota == ('GET', 'health', 1):
+            contagem = {}
+            for j in self.jobs.values():
+                s = j.to_dict()['status']
+                contagem[s] = contagem.get(s, 0) + 1
+            await _send_json(writer, 200, {'status': 'ok', 'workers': self.workers, 'jobs': contagem})
+        elif rota == ('POST', 'uploads', 1):
+            nome = await self.save_upload(reader, length, query.get('ext', 'csv').lower())
+            await _send_json(writer, 201, {'upload': nome, 'bytes': length})
+        elif rota == ('POST', 'jobs', 1):
+            job = self.submit(self.parse_spec(await body()))
+            await _send_json(writer, 202, job.to_dict(), {'Location': f"/jobs/{job.id}"})
+        elif rota == ('GET', 'jobs', 1):
+            await _send_json(writer, 200, [j.to_dict() for j in self.jobs.values()])
+        elif rota == ('GET', 'jobs', 2):
+            await _send_json(writer, 200, self.job(partes[1]).to_dict())
+        elif rota == ('DELETE', 'jobs', 2):
+            job = self.job(partes[1])
+            self.discard(job)
+            await _send_json(writer, 200, {'id': job.id, 'discarded': True})
+        elif rota == ('GET', 'jobs', 3) and partes[2] == 'result':
+            await self._send_result(writer, self.job(partes[1]))
+        elif rota == ('POST', 'reconcile', 1):
+            job = self.submit(self.parse_spec(await body()))
+            await job.done.wait()
+            await self._send_result(writer, job)
+        else:
+            raise HTTPError(404 if method in ('GET', 'POST', 'DELETE') else 405, f"Rota desconhecida: {method} {url.path}")
+
+    async def _send_result(self, writer, job):
+        if job.status == 'failed':
+            raise HTTPError(500, job.error)
+        if not job.done.is_set() or job.status != 'done':
+            raise HTTPError(409, f"Job {job.id} ainda não terminou ({job.to_dict()['status']})")
+        await _send_file(writer, job.output, FORMATS[job.spec['format']],
+                         {'X-Job-Id': job.id, 'X-Report-Rows': str(job.result['rows'])})
+
+def _head(status, headers):
+    linhas = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", "Connection: close",
+              *(f"{k}: {v}" for k, v in headers.items())]
+    return ("\r\n".join(linhas) + "\r\n\r\n").encode('latin-1')
+
+async def _send_json(writer, status, obj, headers=None):
+    corpo = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+    writer.write(_head(status, {'Content-Type': 'application/json; charset=utf-8',
+                                'Content-Length': len(corpo), **(headers or {})}) + corpo)
+    await writer.drain()
+
+async def _send_file(writer, path, content_type, headers=None):
+    """Envia `path` em blocos (Transfer-Encoding: chunked), sem carregá-lo inteiro na memória."""
+    loop = asyncio.get_running_loop()
+    writer.write(_head(200, {'Content-Type': content_type, 'Transfer-Encoding': 'chunked', **(headers or {})}))
+    with open(path, 'rb') as fh:
+        while True:
+            bloco = await loop.run_in_executor(None, fh.read, STREAM_BLOCK)
+            if not bloco:
+                break
+            writer.write(b"%x\r\n%s\r\n" % (len(bloco), bloco))
+            await writer.drain()
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+async def serve(host='127.0.0.1', port=DEFAULT_PORT, workers=2, spool_dir=DEFAULT_SPOOL_DIR, cache_dir=None,
+                hot_inputs=HOT_INPUTS, ready=None):
+    """Sobe o serviço e atende até ser cancelado. `ready(porta)` é chamado quando aceita conexões."""
+    service = ReconciliationService(workers, spool_dir, cache_dir, hot_inputs)
+    try:
+        await service.warm_up()
+        server = await asyncio.start_server(service.handle, host, port)
+        porta = server.sockets[0].getsockname()[1]
+        logger.info(f"Serviço de reconciliação em http://{host}:{porta}")
+        if ready is not None:
+            ready(porta)
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+def build_parser():
+    p = argparse.ArgumentParser(description="Serviço HTTP local de reconciliação de estoque (fila de jobs e processos aquecidos).")
+    p.add_argument('--host', default='127.0.0.1', help="endereço de escuta (padrão: só a máquina local)")
+    p.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"porta (padrão: {DEFAULT_PORT}; 0 escolhe uma livre)")
+    p.add_argument('--workers', type=int, default=2, help="processos de trabalho")
+    p.add_argument('--hot-inputs', type=int, default=HOT_INPUTS, help="entradas mantidas em memória por processo")
+    p.add_argument('--spool-dir', default=DEFAULT_SPOOL_DIR, help="diretório de uploads e resultados")
+    p.add_argument('--cache-dir', help="habilita também o cache em disco de entradas normalizadas")
+    return p
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.spool_dir, args.cache_dir, args.hot_inputs))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
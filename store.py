@@ -0,0 +1,216 @@
+# store.py
+"""
+Sessão de reconciliação persistida em SQLite.
+
+Guarda os movimentos agregados (produto, data) e o relatório de
+discrepâncias de uma execução em um único arquivo .db, com índices em
+(produto, data) e no tipo de discrepância. Páginas do relatório, filtros
+por produto/tipo e o histórico de movimentos de um produto são consultas
+indexadas; reabrir o arquivo recupera a sessão sem recalcular nada.
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import logging
+from core import REPORT_COLUMNS, SUGESTAO_DTYPE, TIPO_DTYPE
+from cache import DEFAULT_CACHE_DIR
+from incremental import MOVEMENT_COLUMNS, _movements
+
+logger = logging.getLogger("store")
+
+# Sessão da última execução na interface
+DEFAULT_SESSION_PATH = os.path.join(DEFAULT_CACHE_DIR, 'ultima_sessao.db')
+
+# Linhas por lote nas inserções
+INSERT_BATCH = 50_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (chave TEXT PRIMARY KEY, valor TEXT);
+CREATE TABLE IF NOT EXISTS sugestoes (codigo INTEGER PRIMARY KEY, modelo TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS movimentos (
+    produto TEXT NOT NULL, data TEXT NOT NULL,
+    quantidade_comprada INTEGER, quantidade_vendida INTEGER, quantidade_em_estoque INTEGER,
+    PRIMARY KEY (produto, data)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS relatorio (
+    id INTEGER PRIMARY KEY,
+    produto TEXT NOT NULL, data TEXT NOT NULL,
+    estoque_anterior INTEGER, compras INTEGER, vendas INTEGER, estoque_atual INTEGER,
+    estoque_esperado INTEGER, diferenca INTEGER,
+    tipo_discrepancia TEXT NOT NULL, sugestao INTEGER NOT NULL
+);
+"""
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS relatorio_produto_data ON relatorio (produto, data);
+CREATE INDEX IF NOT EXISTS relatorio_tipo ON relatorio (tipo_discrepancia);
+"""
+_NULLABLE = ['estoque_anterior', 'estoque_atual', 'estoque_esperado', 'diferenca']
+
+def _column_values(values):
+    """Coluna como lista Python para o sqlite3 (nulos -> None, datas -> 'AAAA-MM-DD')."""
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return np.datetime_as_string(values.to_numpy(), unit='D').tolist()
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(object)
+    return values.astype(object).where(values.notna(), None).tolist()
+
+class ReconciliationStore:
+    """
+    Arquivo de sessão (SQLite) com movimentos, relatório e metadados.
+
+    Uma conexão é compartilhada entre a thread da UI e a de trabalho,
+    serializada por um lock.
+    """
+
+    def __init__(self, path=DEFAULT_SESSION_PATH):
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA + _INDEXES)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return pd.read_sql_query(sql, self._conn, params=params)
+
+    # Gravação
+    def save(self, report, aggs=None, **meta):
+        """
+        Substitui o conteúdo da sessão pelo `report` e pelos movimentos `aggs`
+        (compras_agg, vendas_agg, estoque_agg). `meta` (tolerância, arquivos
+        de entrada...) é guardado como texto. Retorna o número de linhas.
+        """
+        total = 0
+        for chunk in self.tee([report], aggs, **meta):
+            total += len(chunk)
+        return total
+
+    def tee(self, chunks, aggs=None, **meta):
+        """
+        Como `save`, mas para um relatório em blocos: grava cada bloco e o
+        repassa adiante (ex.: para o gravador de CSV do modo streaming).
+        A sessão só é confirmada depois do último bloco.
+        """
+        c = self._conn
+        modelos = {m: i for i, m in enumerate(SUGESTAO_DTYPE.categories)}
+        with self._lock:
+            c.execute("PRAGMA synchronous = OFF")
+            c.executescript("DROP INDEX IF EXISTS relatorio_produto_data; DROP INDEX IF EXISTS relatorio_tipo;")
+            c.execute("BEGIN")
+            for tabela in ('relatorio', 'movimentos', 'sugestoes', 'meta'):
+                c.execute(f"DELETE FROM {tabela}")
+            meta = {'criado_em': datetime.now().isoformat(timespec='seconds'), **meta}
+            c.executemany("INSERT INTO meta VALUES (?, ?)", [(k, str(v)) for k, v in meta.items()])
+            if aggs is not None:
+                self._insert('movimentos', _movements(*aggs).sort_values(['produto', 'data']), MOVEMENT_COLUMNS)
+        ok = False
+        try:
+            inicio = 0
+            for chunk in chunks:
+                if not chunk.empty:
+                    rel = chunk[REPORT_COLUMNS].copy()
+                    # Sugestão como código do modelo; textos já renderizados viram modelos próprios
+                    for valor in rel['sugestao'].astype(object).unique():
+                        modelos.setdefault(valor, len(modelos))
+                    rel['sugestao'] = rel['sugestao'].astype(object).map(modelos).to_numpy()
+                    rel.insert(0, 'id', np.arange(inicio, inicio + len(rel)))
+                    with self._lock:
+                        self._insert('relatorio', rel, ['id'] + REPORT_COLUMNS)
+                    inicio += len(rel)
+                yield chunk
+            ok = True
+        finally:
+            with self._lock:
+                if ok:
+                    c.executemany("INSERT INTO sugestoes VALUES (?, ?)", [(i, m) for m, i in modelos.items()])
+                    c.commit()
+                    logger.info(f"Sessão salva em {self.path}: {inicio} discrepâncias")
+                else:
+                    c.rollback()
+                c.executescript(_INDEXES)
+
+    def _insert(self, table, df, cols):
+        sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join('?' * len(cols))})"
+        for inicio in range(0, len(df), INSERT_BATCH):
+            parte = df.iloc[inicio:inicio + INSERT_BATCH]
+            self._conn.executemany(sql, zip(*(_column_values(parte[col]) for col in cols)))
+
+    def backup(self, path):
+        """Copia a sessão para outro arquivo (ex.: "Salvar sessão como")."""
+        with self._lock:
+            dest = sqlite3.connect(path)
+            try:
+                self._conn.backup(dest)
+            finally:
+                dest.close()
+
+    # Consultas
+    def meta(self):
+        return dict(self._query("SELECT chave, valor FROM meta").itertuples(index=False))
+
+    def _where(self, produto=None, tipo=None):
+        conds, params = [], []
+        if produto is not None:
+            conds.append("produto = ?"); params.append(produto)
+        if tipo is not None:
+            conds.append("tipo_discrepancia = ?"); params.append(tipo)
+        return (" WHERE " + " AND ".join(conds)) if conds else "", params
+
+    def _to_report(self, df):
+        """Linhas lidas do banco -> mesmos tipos do relatório de `core` (índice = id)."""
+        if df.empty:
+            return pd.DataFrame()
+        modelos = self._query("SELECT modelo FROM sugestoes ORDER BY codigo")['modelo'].tolist()
+        df = df.set_index('id')
+        df.index.name = None
+        df['data'] = pd.to_datetime(df['data'], format='%Y-%m-%d')
+        for col in _NULLABLE:
+            df[col] = df[col].astype('Int64')
+        df['tipo_discrepancia'] = pd.Categorical(df['tipo_discrepancia'], dtype=TIPO_DTYPE)
+        df['sugestao'] = pd.Categorical.from_codes(df['sugestao'].to_numpy(), categories=modelos)
+        return df[REPORT_COLUMNS]
+
+    def page(self, offset=0, limit=100, produto=None, tipo=None):
+        """Página do relatório (na ordem produto/data), opcionalmente filtrada."""
+        where, params = self._where(produto, tipo)
+        sql = f"SELECT * FROM relatorio{where} ORDER BY id LIMIT ? OFFSET ?"
+        return self._to_report(self._query(sql, params + [limit, offset]))
+
+    def report(self, produto=None, tipo=None):
+        """Relatório completo (ou filtrado), para reabrir a sessão."""
+        where, params = self._where(produto, tipo)
+        return self._to_report(self._query(f"SELECT * FROM relatorio{where} ORDER BY id", params))
+
+    def history(self, produto, start=None, end=None):
+        """
+        Movimentos do produto dia a dia, com o tipo de discrepância do dia
+        (vazio quando o dia não foi sinalizado).
+        """
+        conds, params = ["m.produto = ?"], [produto]
+        if start is not None:
+            conds.append("m.data >= ?"); params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+        if end is not None:
+            conds.append("m.data <= ?"); params.append(pd.Timestamp(end).strftime('%Y-%m-%d'))
+        df = self._query(
+            "SELECT m.data, m.quantidade_comprada AS compras, m.quantidade_vendida AS vendas, "
+            "m.quantidade_em_estoque AS estoque, r.tipo_discrepancia "
+            "FROM movimentos m LEFT JOIN relatorio r ON r.produto = m.produto AND r.data = m.data "
+            f"WHERE {' AND '.join(conds)} ORDER BY m.data", params)
+        df['data'] = pd.to_datetime(df['data'], format='%Y-%m-%d')
+        for col in ('compras', 'vendas', 'estoque'):
+            df[col] = df[col].astype('Int64')
+        return df
@@ -0,0 +1,205 @@
+# streaming.py
+import os
+import pandas as pd
+import logging
+import perf
+from core import _ensure_df, _check_cancel, render_report, DEFAULT_KEYS, REPORT_COLUMNS
+from loaders import DATE_FORMAT, format_errors, normalize_frame, open_csv
+from workbook import SHEETS, is_workbook, read_sheets
+
+logger = logging.getLogger("streaming")
+
+DEFAULT_CHUNKSIZE = 500_000
+
+# Colunas de quantidade de cada entrada
+QTY_COLUMNS = {
+    'compras': 'quantidade_comprada',
+    'vendas': 'quantidade_vendida',
+    'estoque': 'quantidade_em_estoque',
+}
+
+def _combine(partes, qty_col, keys=DEFAULT_KEYS):
+    """Soma parciais (chave, data) de vários blocos em uma única agregação."""
+    return pd.concat(partes, ignore_index=True).groupby([*keys, 'data'], as_index=False, observed=True)[qty_col].sum()
+
+def read_csv_aggregated(path, qty_col, chunksize=DEFAULT_CHUNKSIZE, compact_every=20, cancel=None,
+                        date_format=DATE_FORMAT, errors=None, keys=DEFAULT_KEYS):
+    """
+    Lê um CSV em blocos e devolve a soma de `qty_col` por chave (`keys`)/dia.
+
+    Só as colunas data/produto/quantidade são lidas, já tipadas (ver
+    `loaders`). Cada bloco é agregado assim que chega; as parciais são
+    compactadas a cada `compact_every` blocos, então a memória fica limitada
+    ao número de pares (produto, data) distintos e não ao tamanho do arquivo.
+
+    O tempo de cada fase fica nas etapas 'read', 'normalize' e 'aggregate'
+    (ver `perf`). `cancel()` é consultado a cada bloco.
+    Linhas rejeitadas são resumidas no log e, se `errors` (lista) for
+    informado, anexadas a ele como um frame (ver `loaders.ERROR_COLUMNS`).
+    """
+    partes = []
+    rejeitadas = []
+    reader = open_csv(path, qty_col, chunksize, keys)
+    linha = 2
+    while True:
+        _check_cancel(cancel)
+        with perf.stage('read') as st:
+            chunk = next(reader, None)
+            st.count('rows_out', 0 if chunk is None else len(chunk))
+        if chunk is None:
+            break
+        with perf.stage('normalize', rows_in=len(chunk)) as st:
+            lido = normalize_frame(chunk, qty_col, date_format, first_line=linha, keys=keys)
+            st.count('rows_out', len(lido.frame))
+        linha += len(chunk)
+        if len(lido.errors):
+            rejeitadas.append(lido.errors)
+        with perf.stage('aggregate', rows_in=len(lido.frame)):
+            partes.append(lido.frame.groupby([*keys, 'data'], as_index=False, observed=True)[qty_col].sum())
+            if len(partes) >= compact_every:
+                partes = [_combine(partes, qty_col, keys)]
+    if rejeitadas:
+        rejeitadas = pd.concat(rejeitadas, ignore_index=True)
+        logger.warning(format_errors(rejeitadas, path))
+        if errors is not None:
+            errors.append(rejeitadas)
+    if not partes:
+        return _ensure_df(None, [*keys, 'data', qty_col])
+    with perf.stage('aggregate'):
+        return _combine(partes, qty_col, keys)
+
+def load_inputs(paths, chunksize=DEFAULT_CHUNKSIZE, cache=None, cancel=None, workers=None,
+                date_format=DATE_FORMAT, errors=None, keys=DEFAULT_KEYS):
+    """
+    Agrega as entradas de `paths` (nome -> arquivo); devolve dict nome -> agregado.
+
+    CSVs são lidos em streaming. Planilhas .xlsx usam a aba de mesmo nome da
+    entrada (ver `workbook.SHEETS`), e as abas pendentes são lidas em
+    paralelo (até `workers` processos). Com `cache` (um `cache.InputCache`),
+    arquivos inalterados são lidos do cache. Se `errors` (dict) for informado,
+    recebe nome -> linhas rejeitadas dos CSVs e abas (também nos acertos de cache; ver `loaders`). `keys`
+    são as colunas que identificam cada cadeia de estoque (padrão: produto).
+    """
+    with perf.stage('load'):
+        return _load_inputs(paths, chunksize, cache, cancel, workers, date_format, errors, tuple(keys))
+
+def _load_inputs(paths, chunksize, cache, cancel, workers, date_format, errors, keys):
+    aggs = {}
+    planilhas = {}
+    for nome, path in paths.items():
+        _check_cancel(cancel)
+        with perf.stage(nome) as st:
+            rejeitadas = []
+            agg = cache.get(path, QTY_COLUMNS[nome], keys, errors=rejeitadas, date_format=date_format) if cache is not None else None
+            if agg is not None:
+                logger.info(f"Cache: {os.path.basename(path)} ({nome}) reaproveitado")
+                st.count('cache_hits', 1)
+                if rejeitadas:
+                    # Mesmo aviso da primeira leitura, guardado junto da entrada
+                    logger.warning(format_errors(rejeitadas[0], path))
+            elif is_workbook(path):
+                planilhas[nome] = (path, SHEETS[nome], QTY_COLUMNS[nome], keys, date_format)
+                continue
+            else:
+                agg = read_csv_aggregated(path, QTY_COLUMNS[nome], chunksize, cancel=cancel,
+                                          date_format=date_format, errors=rejeitadas, keys=keys)
+                if cache is not None:
+                    cache.put(path, QTY_COLUMNS[nome], agg, keys, errors=rejeitadas[0] if rejeitadas else None,
+                              date_format=date_format)
+            if rejeitadas:
+                st.count('rows_rejected', len(rejeitadas[0]))
+                if errors is not None:
+                    errors[nome] = rejeitadas[0]
+            st.count('rows_out', len(agg))
+        aggs[nome] = agg
+    if planilhas:
+        with perf.stage('workbook') as st:
+            lidas = read_sheets(planilhas, workers, aggregated=True)
+            st.count('rows_out', sum(len(l.frame) for l in lidas.values()))
+            st.count('rows_rejected', sum(len(l.errors) for l in lidas.values()))
+        for nome, lido in lidas.items():
+            agg = lido.frame
+            if len(lido.errors):
+                logger.warning(format_errors(lido.errors, f"{paths[nome]} [{nome}]"))
+                if errors is not None:
+                    errors[nome] = lido.errors
+            if cache is not None:
+                cache.put(paths[nome], QTY_COLUMNS[nome], agg, keys, errors=lido.errors, date_format=date_format)
+            aggs[nome] = agg
+    for nome in paths:
+        logger.info(f"{nome}: {len(aggs[nome])} pares {'/'.join(keys)}/dia agregados")
+    return {nome: aggs[nome] for nome in paths}
+
+def load_aggregated(compras_path, vendas_path, estoque_path, chunksize=DEFAULT_CHUNKSIZE, cache=None,
+                    cancel=None, workers=None, date_format=DATE_FORMAT, errors=None, keys=DEFAULT_KEYS):
+    """Agrega os três arquivos (CSV ou .xlsx); retorna (compras_agg, vendas_agg, estoque_agg)."""
+    paths = {'compras': compras_path, 'vendas': vendas_path, 'estoque': estoque_path}
+    aggs = load_inputs(paths, chunksize, cache, cancel, workers, date_format, errors, keys)
+    return aggs['compras'], aggs['vendas'], aggs['estoque']
+
+# Compressão da saída CSV, inferida pela extensão
+CSV_COMPRESSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz'}
+
+def _open_text(path, compression=None):
+    """Abre `path` para escrita de texto, comprimido com gzip/bz2/xz (módulos da biblioteca padrão)."""
+    if compression == 'infer':
+        compression = CSV_COMPRESSIONS.get(os.path.splitext(path)[1].lower())
+    if compression is None:
+        return open(path, 'w', newline='', encoding='utf-8')
+    if compression == 'gzip':
+        import gzip
+        return gzip.open(path, 'wt', newline='', encoding='utf-8', compresslevel=6)
+    if compression == 'bz2':
+        import bz2
+        return bz2.open(path, 'wt', newline='', encoding='utf-8')
+    if compression == 'xz':
+        import lzma
+        return lzma.open(path, 'wt', newline='', encoding='utf-8')
+    raise ValueError(f"Compressão desconhecida '{compression}'. Opções: {', '.join(CSV_COMPRESSIONS.values())}")
+
+def report_columns(keys=DEFAULT_KEYS):
+    """Colunas do relatório com as chaves `keys` no lugar de `produto`."""
+    return [*keys, *REPORT_COLUMNS[1:]]
+
+def write_report_stream(chunks, output_path, compression='infer', keys=DEFAULT_KEYS):
+    """
+    Grava blocos do relatório em CSV conforme chegam; retorna o total de linhas.
+
+    `compression` ('gzip', 'bz2', 'xz' ou None) é inferida da extensão por padrão.
+    """
+    total = 0
+    with _open_text(output_path, compression) as fh:
+        pd.DataFrame(columns=report_columns(keys)).to_csv(fh, index=False)
+        for chunk in chunks:
+            render_report(chunk).to_csv(fh, index=False, header=False, date_format='%Y-%m-%d')
+            total += len(chunk)
+    return total
+
+# Colunas que podem ficar vazias; gravadas como inteiros anuláveis para manter o mesmo esquema em todos os blocos
+NULLABLE_COLUMNS = ['estoque_anterior','estoque_atual','estoque_esperado','diferenca']
+
+def write_report_parquet(chunks, output_path, compression='snappy', keys=DEFAULT_KEYS):
+    """Grava blocos do relatório em um arquivo Parquet (um row group por bloco, `compression` do pyarrow)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError("Saída Parquet requer o pacote 'pyarrow' (pip install pyarrow)") from e
+
+    schema = pa.schema([
+        *((k, pa.string()) for k in keys), ('data', pa.timestamp('ns')),
+        ('estoque_anterior', pa.int64()), ('compras', pa.int64()), ('vendas', pa.int64()),
+        ('estoque_atual', pa.int64()), ('estoque_esperado', pa.int64()), ('diferenca', pa.int64()),
+        ('tipo_discrepancia', pa.string()), ('sugestao', pa.string()),
+    ])
+    # Metadados do pandas no arquivo: as colunas de estoque voltam como Int64 (com nulos) na leitura
+    modelo = pd.DataFrame({c: pd.Series(dtype='Int64' if c in NULLABLE_COLUMNS or c in ('compras', 'vendas') else object)
+                           for c in report_columns(keys)}).astype({'data': 'datetime64[ns]', 'compras': 'int64', 'vendas': 'int64'})
+    schema = schema.with_metadata(pa.Schema.from_pandas(modelo, preserve_index=False).metadata)
+    total = 0
+    with pq.ParquetWriter(output_path, schema, compression=compression) as writer:
+        for chunk in chunks:
+            chunk = render_report(chunk).astype({'tipo_discrepancia': object, **{c: 'Int64' for c in NULLABLE_COLUMNS}})
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            total += len(chunk)
+    return total
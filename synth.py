@@ -0,0 +1,109 @@
+# synth.py
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+
+@dataclass
+class SyntheticData:
+    compras: pd.DataFrame
+    vendas: pd.DataFrame
+    estoque: pd.DataFrame
+    # Discrepâncias injetadas: produto, data, tipo_discrepancia
+    expected: pd.DataFrame
+
+def generate_synthetic(products=1000, days=30, density=0.3, missing_purchase_rate=0.01,
+                       missing_sale_rate=0.01, stock_error_rate=0.01, seed=0,
+                       start='2025-01-01', date_strings=True):
+    """
+    Gera compras/vendas/estoque sintéticos com discrepâncias conhecidas.
+
+    Cada produto tem estoque informado todos os dias e, a cada dia, compra
+    e/ou venda com probabilidade `density`. Sobre os dias com movimento são
+    injetadas as frações pedidas de:
+    - compras não registradas (dia só com compra; o estoque a inclui)
+      -> 'falta_registro_compra';
+    - vendas não registradas (dia só com venda) -> 'falta_registro_venda';
+    - erros de lançamento de estoque (dia com compra; o estoque passa a
+      ter um desvio permanente a partir dele) -> 'erro_lancamento_estoque'.
+
+    Cada injeção afeta apenas o seu dia, então com tolerância 0 o relatório
+    deve conter exatamente as linhas de `expected`. O primeiro dia não tem
+    movimento (serve de baseline). `date_strings` devolve a data como texto
+    'AAAA-MM-DD', como viria de um CSV.
+    """
+    rng = np.random.default_rng(seed)
+    shape = (products, days)
+    compras = np.where(rng.random(shape) < density, rng.integers(1, 50, shape), 0)
+    vendas = np.where(rng.random(shape) < density, rng.integers(1, 50, shape), 0)
+    compras[:, 0] = 0
+    vendas[:, 0] = 0
+    estoque = rng.integers(500, 1000, (products, 1)) + np.cumsum(compras - vendas, axis=1)
+
+    escolhido = np.zeros(shape, dtype=bool)
+    esperado = np.full(shape, '', dtype=object)
+
+    def sortear(candidatos, rate):
+        idx = np.flatnonzero(candidatos & ~escolhido)
+        idx = rng.choice(idx, size=int(round(len(idx) * rate)), replace=False) if len(idx) else idx
+        escolhido.flat[idx] = True
+        return np.unravel_index(idx, shape)
+
+    p, d = sortear((compras > 0) & (vendas == 0), missing_purchase_rate)
+    compras_reg = compras.copy()
+    compras_reg[p, d] = 0
+    esperado[p, d] = 'falta_registro_compra'
+
+    p, d = sortear((vendas > 0) & (compras == 0), missing_sale_rate)
+    vendas_reg = vendas.copy()
+    vendas_reg[p, d] = 0
+    esperado[p, d] = 'falta_registro_venda'
+
+    p, d = sortear(compras_reg > 0, stock_error_rate)
+    desvio = np.zeros(shape, dtype=np.int64)
+    desvio[p, d] = rng.integers(1, 20, len(p))
+    estoque_reg = estoque + np.cumsum(desvio, axis=1)
+    esperado[p, d] = 'erro_lancamento_estoque'
+
+    nomes = np.array([f'SKU{i:07d}' for i in range(products)], dtype=object)
+    datas = pd.date_range(start, periods=days, freq='D')
+    datas = datas.strftime('%Y-%m-%d').to_numpy(dtype=object) if date_strings else datas.to_numpy()
+    produto_col = np.repeat(nomes, days)
+    data_col = np.tile(datas, products)
+
+    def long(valores, col, somente_positivos=True):
+        flat = valores.ravel()
+        sel = np.flatnonzero(flat > 0) if somente_positivos else slice(None)
+        return pd.DataFrame({'data': data_col[sel], 'produto': produto_col[sel], col: flat[sel]})
+
+    sel = np.flatnonzero(esperado.ravel() != '')
+    expected = pd.DataFrame({
+        'produto': produto_col[sel],
+        'data': pd.to_datetime(data_col[sel]),
+        'tipo_discrepancia': esperado.ravel()[sel],
+    })
+    return SyntheticData(
+        compras=long(compras_reg, 'quantidade_comprada'),
+        vendas=long(vendas_reg, 'quantidade_vendida'),
+        estoque=long(estoque_reg, 'quantidade_em_estoque', somente_positivos=False),
+        expected=expected,
+    )
+
+def verify_report(report, expected):
+    """Compara o relatório com as discrepâncias injetadas; retorna contagens e `ok`."""
+    keys = ['produto', 'data']
+    exp = expected.astype({'produto': object, 'tipo_discrepancia': object})
+    if report.empty:
+        got = exp.iloc[:0]
+    else:
+        got = report[keys + ['tipo_discrepancia']].astype({'produto': object, 'tipo_discrepancia': object})
+    m = exp.merge(got, on=keys, how='outer', suffixes=('_esperado', '_obtido'), indicator=True)
+    ambos = m[m['_merge'] == 'both']
+    result = {
+        'expected': len(exp),
+        'found': len(got),
+        'missing': int((m['_merge'] == 'left_only').sum()),
+        'unexpected': int((m['_merge'] == 'right_only').sum()),
+        'wrong_tipo': int((ambos['tipo_discrepancia_esperado'] != ambos['tipo_discrepancia_obtido']).sum()),
+    }
+    result['ok'] = result['missing'] == result['unexpected'] == result['wrong_tipo'] == 0
+    return result
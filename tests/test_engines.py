@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from core import (PreparedChains, _detect_loop, _detect_vectorized, aggregate_inputs, get_example_data,
+                  render_report)
+
+def _dados(seed, produtos=6, dias=8, linhas=60):
+    """Movimentos aleatórios com dias repetidos, estoques ausentes e, às vezes, sem compras."""
+    rng = np.random.default_rng(seed)
+
+    def movimentos(col, n, decimal=False):
+        qtd = rng.integers(0, 20, n)
+        return pd.DataFrame({
+            'data': (pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, dias, n), 'D')).strftime('%Y-%m-%d'),
+            'produto': [f'P{i:02d}' for i in rng.integers(0, produtos, n)],
+            col: qtd.astype(float) if decimal else qtd,
+        })
+
+    compras = movimentos('quantidade_comprada', linhas)
+    vendas = movimentos('quantidade_vendida', linhas, decimal=seed % 3 == 0)
+    estoque = movimentos('quantidade_em_estoque', linhas // 2)
+    if seed % 5 == 0:
+        estoque.loc[estoque.index[:3], 'quantidade_em_estoque'] = np.nan
+    if seed % 7 == 0:
+        compras = compras.iloc[:0]
+    return compras, vendas, estoque
+
+def _sem_diferenca():
+    """Compra e venda iguais com estoque estável: diferença 0, só sinalizada com tolerância negativa."""
+    return (pd.DataFrame({'data': ['2025-01-02'], 'produto': ['A'], 'quantidade_comprada': [5]}),
+            pd.DataFrame({'data': ['2025-01-02', '2025-01-03'], 'produto': ['A', 'A'], 'quantidade_vendida': [5, 0]}),
+            pd.DataFrame({'data': ['2025-01-01', '2025-01-02', '2025-01-03'], 'produto': ['A', 'A', 'A'],
+                          'quantidade_em_estoque': [10, 10, 10]}))
+
+CASOS = ([(_dados(seed), seed % 4) for seed in range(60)] + [(_dados(seed), -1) for seed in range(60, 70)]
+         + [(get_example_data(), 2), (_sem_diferenca(), -1)])
+
+def _relatorio(report):
+    return render_report(report).reset_index(drop=True)
+
+@pytest.mark.parametrize('entradas,tolerancia', CASOS)
+def test_motor_vetorizado_igual_ao_loop(entradas, tolerancia):
+    aggs = aggregate_inputs(*entradas)
+    esperado = _relatorio(_detect_loop(*aggs, tolerancia))
+
+    pd.testing.assert_frame_equal(_relatorio(_detect_vectorized(*aggs, tolerancia)), esperado)
+    # Em blocos (com progresso) e com as cadeias preparadas, a saída é a mesma
+    feitos = []
+    em_blocos = _detect_vectorized(*aggs, tolerancia, progress=lambda f, t: feitos.append(f))
+    pd.testing.assert_frame_equal(_relatorio(em_blocos), esperado)
+    pd.testing.assert_frame_equal(_relatorio(PreparedChains(*aggs).reconcile(tolerancia)), esperado)
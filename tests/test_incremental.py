@@ -0,0 +1,31 @@
+import pandas as pd
+
+from core import detect_discrepancies
+from incremental import IncrementalReconciler
+
+def _dia(data, produto, **quantidades):
+    linhas = {col: pd.DataFrame({'data': [pd.Timestamp(data)], 'produto': [produto], col: [q]})
+              for col, q in quantidades.items()}
+    return (linhas.get('quantidade_comprada'), linhas.get('quantidade_vendida'), linhas.get('quantidade_em_estoque'))
+
+def test_skus_com_zeros_a_esquerda_sobrevivem_ao_checkpoint_e_ao_diario(tmp_path):
+    inc = IncrementalReconciler(str(tmp_path))
+    assert inc.update(*_dia('2025-01-01', '001', quantidade_em_estoque=10)).report.empty
+
+    # Queda de estoque sem venda: a cadeia continua do checkpoint de '001'
+    r = inc.update(*_dia('2025-01-02', '001', quantidade_em_estoque=7))
+    assert r.report['produto'].tolist() == ['001']
+    assert r.report['tipo_discrepancia'].tolist() == ['falta_registro_venda']
+    assert inc.load_checkpoint().index.tolist() == ['001']
+
+    # Venda atrasada do dia 2: recalcula '001' com o histórico do diário
+    r = inc.update(*_dia('2025-01-02', '001', quantidade_vendida=3))
+    assert r.recomputed == ['001']
+    assert r.report.empty
+    assert inc.load_checkpoint().index.tolist() == ['001']
+
+    compras = pd.DataFrame({'data': pd.to_datetime([]), 'produto': pd.Series([], dtype=str), 'quantidade_comprada': []})
+    vendas = pd.DataFrame({'data': [pd.Timestamp('2025-01-02')], 'produto': ['001'], 'quantidade_vendida': [3]})
+    estoque = pd.DataFrame({'data': pd.to_datetime(['2025-01-01', '2025-01-02']), 'produto': ['001', '001'],
+                            'quantidade_em_estoque': [10, 7]})
+    assert detect_discrepancies(compras, vendas, estoque).empty
@@ -0,0 +1,96 @@
+import asyncio
+import io
+import json
+import os
+import signal
+import threading
+import time
+import urllib.request
+
+import pandas as pd
+import pytest
+
+import service
+from core import detect_discrepancies, get_example_data, render_report
+
+def _entradas(tmp_path):
+    paths = {}
+    for nome, df in zip(('compras', 'vendas', 'estoque'), get_example_data()):
+        paths[nome] = str(tmp_path / f'{nome}.csv')
+        df.to_csv(paths[nome], index=False)
+    return paths
+
+@pytest.fixture
+def servidor(tmp_path):
+    """Serviço em uma porta livre de 127.0.0.1, rodando em uma thread própria."""
+    pronto, estado = threading.Event(), {}
+
+    def rodar():
+        loop = asyncio.new_event_loop()
+        estado['loop'] = loop
+        estado['task'] = loop.create_task(service.serve(port=0, workers=1, spool_dir=str(tmp_path / 'spool'),
+                                                        ready=lambda porta: (estado.update(porta=porta), pronto.set())))
+        try:
+            loop.run_until_complete(estado['task'])
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=rodar, daemon=True)
+    thread.start()
+    assert pronto.wait(120), "serviço não ficou pronto"
+    yield f"http://127.0.0.1:{estado['porta']}"
+    estado['loop'].call_soon_threadsafe(estado['task'].cancel)
+    thread.join(30)
+
+def _chamar(base, metodo, caminho, corpo=None):
+    dados = json.dumps(corpo).encode() if corpo is not None else None
+    req = urllib.request.Request(base + caminho, data=dados, method=metodo, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(req, timeout=60) as resp:
+        return resp.status, resp.read()
+
+def test_job_enviado_acompanhado_e_baixado(servidor, tmp_path):
+    paths = _entradas(tmp_path)
+    status, corpo = _chamar(servidor, 'POST', '/jobs', {**paths, 'tolerance': 2})
+    assert status == 202
+    job = json.loads(corpo)
+
+    prazo = time.monotonic() + 120
+    while True:
+        info = json.loads(_chamar(servidor, 'GET', f"/jobs/{job['id']}")[1])
+        if info['status'] in ('done', 'failed') or time.monotonic() > prazo:
+            break
+        time.sleep(0.05)
+    assert info['status'] == 'done', info
+
+    status, corpo = _chamar(servidor, 'GET', f"/jobs/{job['id']}/result")
+    assert status == 200
+    recebido = pd.read_csv(io.BytesIO(corpo))
+    esperado = render_report(detect_discrepancies(*get_example_data(), tolerance=2))
+    assert recebido['produto'].tolist() == esperado['produto'].tolist()
+    assert recebido['tipo_discrepancia'].tolist() == esperado['tipo_discrepancia'].astype(str).tolist()
+
+def test_processo_encerrado_e_recriado_uma_vez(tmp_path):
+    paths = list(_entradas(tmp_path).values())
+
+    async def cenario():
+        svc = service.ReconciliationService(workers=1, spool_dir=str(tmp_path / 'spool'))
+        try:
+            await svc.warm_up()
+            quebrado = svc.pools[0]
+            criados = []
+            novo_pool = svc._new_pool
+            svc._new_pool = lambda: criados.append(novo_pool()) or criados[-1]
+            spec = {'paths': paths, 'tolerance': 0, 'keys': ['produto'], 'format': 'csv'}
+            jobs = [svc.submit(spec) for _ in range(3)]
+            for pid in list(quebrado._processes):
+                os.kill(pid, signal.SIGKILL)
+            await asyncio.gather(*(job.done.wait() for job in jobs))
+            return quebrado, criados, svc.pools[0], jobs
+        finally:
+            svc.close()
+
+    quebrado, criados, atual, jobs = asyncio.run(cenario())
+    assert any(job.status == 'failed' for job in jobs)
+    assert len(criados) == 1 and atual is criados[0] and atual is not quebrado
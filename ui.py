@@ -1,14 +1,54 @@
 # ui.py
+import os
+import queue
+import threading
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, filedialog, messagebox
 from tkinter.scrolledtext import ScrolledText
-import pandas as pd
-from core import detect_discrepancies, get_example_data
+import time
+import perf
 import logging
 
-logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
 logger = logging.getLogger("ui")
 
+# Pandas, o motor e os leitores só são importados depois que a janela aparece,
+# na thread de trabalho (ver `_load_backend`); até lá os nomes abaixo ficam
+# vazios e as ações que dependem deles, desabilitadas.
+np = pd = None
+
+def _load_backend():
+    """Importa os módulos pesados e publica neste módulo os nomes usados pela interface."""
+    global np, pd, _check_cancel, aggregate_inputs, format_sugestao, get_example_data, PreparedChains, \
+        ReconciliationCancelled, load_aggregated, load_inputs, InputCache, ReportIndex, is_workbook, \
+        format_errors, export_report, DEFAULT_SESSION_PATH, ReconciliationStore
+    import numpy as np
+    import pandas as pd
+    from core import _check_cancel, aggregate_inputs, format_sugestao, get_example_data, PreparedChains, ReconciliationCancelled
+    from streaming import load_aggregated, load_inputs
+    from cache import InputCache
+    from search import ReportIndex
+    from workbook import is_workbook
+    from loaders import format_errors
+    from export import export_report
+    from store import DEFAULT_SESSION_PATH, ReconciliationStore
+
+def _indexed(report):
+    """(relatório com índice 0..n-1, ReportIndex) — chamado na thread de trabalho, não na da Tk."""
+    report = report.reset_index(drop=True)
+    with perf.stage('search_index', rows_in=len(report)):
+        return report, ReportIndex(report)
+
+def _fmt_int(v):
+    """Quantidade para exibição: inteiro sem casas decimais, vazio quando ausente."""
+    return '' if pd.isna(v) else int(v)
+
+def _sugestao_texto(row):
+    """Texto da sugestão de uma linha (formatado só quando exibido)."""
+    if not isinstance(row.sugestao, str):
+        return ''
+    return format_sugestao(row.sugestao, row.diferenca, row.estoque_esperado)
+
 class StockValidatorApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -25,18 +65,70 @@ class StockValidatorApp(tk.Tk):
         self.style = ttk.Style(self)
         self.configure(bg=self.themes[self.current_theme]["bg"])
 
-        # Data containers
+        # Data containers (o relatório vazio é criado quando o pandas termina de carregar)
         self.compras_df = None
         self.vendas_df = None
         self.estoque_df = None
-        self.report_df = pd.DataFrame()
-
+        self.report_df = None
+        self.view_df = None
+        self.view_pos = None
+        self.search_index = None
+        self._offset = 0
+        self._selected_iid = None
+        self._filter_job = None
+        self._last_filter = None
+        self.compras_path = None
+        self.vendas_path = None
+        self.estoque_path = None
+        self.input_cache = None
+        # Cadeias já montadas (core.PreparedChains) das entradas atuais: mudar só a
+        # tolerância reclassifica sem reler/reagregar; invalidadas quando uma entrada muda
+        self._prepared = None
+        self._prepared_key = None
+        # Sessão (SQLite) do relatório exibido: a última execução ou um arquivo reaberto
+        self.store = None
+        # Diagnóstico: instrumentação (perf.Recorder) da última geração de relatório, se ligada
+        self.recorder = None
+        self.diag_window = None
+
+        # Carga e reconciliação rodam em uma thread de trabalho; a UI só consome a fila
+        self._worker = ThreadPoolExecutor(max_workers=1)
+        # Sessão SQLite (gravar, abrir, histórico) em outra thread: regerar o relatório
+        # com outra tolerância não espera a gravação da sessão anterior
+        self._session_worker = ThreadPoolExecutor(max_workers=1)
+        self._ui_queue = queue.Queue()
+        self._cancel_event = threading.Event()
+        self._report_running = False
+
+        # Só os controles são montados antes de a janela aparecer; a tabela e as
+        # ações que usam o pandas chegam com `_on_backend_ready`
+        self._t0 = time.perf_counter()
         self._build_ui()
+        self.protocol("WM_DELETE_WINDOW", self._on_close)
+        self.after(self.QUEUE_POLL_MS, self._poll_queue)
+        self.status['text'] = "Carregando componentes..."
+        self._submit(_load_backend, self._on_backend_ready, self._on_backend_error)
+
+    def _on_backend_ready(self, _):
+        self.report_df = pd.DataFrame()
+        self.view_df = self.report_df
+        self.view_pos = np.arange(0)
+        self.input_cache = InputCache()
+        self._build_report_area()
+        for w in self._backend_widgets: w.config(state='normal')
         self._bind_shortcuts()
         self.apply_theme()
+        self.status['text'] = "Pronto"
+        logger.info(f"Componentes carregados em {time.perf_counter() - self._t0:.2f}s")
+
+    def _on_backend_error(self, e):
+        self.status['text'] = "Falha ao carregar componentes."
+        messagebox.showerror("Erro", f"Não foi possível carregar os componentes (pandas/motor): {e}")
 
     def _build_ui(self):
-        top = tk.Frame(self, bg=self.themes[self.current_theme]["bg"])
+        # Botões que dependem do pandas/motor: habilitados em `_on_backend_ready`
+        self._backend_widgets = []
+        top = self._top = tk.Frame(self, bg=self.themes[self.current_theme]["bg"])
         top.pack(side=tk.TOP, fill=tk.X, padx=10, pady=(10,5))
 
         # Left controls
@@ -52,28 +144,53 @@ class StockValidatorApp(tk.Tk):
             entry.pack(side=tk.LEFT, padx=(0,6))
             btn = tk.Button(row, text="Selecionar", command=lambda e=entry, s=setter: s(e))
             btn.pack(side=tk.LEFT)
+            self._backend_widgets.append(btn)
             return entry
 
-        self.entry_compras = make_file_row(left_ctrl, "Compras (CSV):", self._load_compras_from_entry)
-        self.entry_vendas  = make_file_row(left_ctrl, "Vendas (CSV):", self._load_vendas_from_entry)
-        self.entry_estoque = make_file_row(left_ctrl, "Estoque (CSV):", self._load_estoque_from_entry)
+        self.entry_compras = make_file_row(left_ctrl, "Compras (CSV/XLSX):", self._load_compras_from_entry)
+        self.entry_vendas  = make_file_row(left_ctrl, "Vendas (CSV/XLSX):", self._load_vendas_from_entry)
+        self.entry_estoque = make_file_row(left_ctrl, "Estoque (CSV/XLSX):", self._load_estoque_from_entry)
 
         row_tol = tk.Frame(left_ctrl, bg=self.themes[self.current_theme]["bg"])
         row_tol.pack(fill=tk.X, pady=(6,2))
         tk.Label(row_tol, text="Tolerância:", bg=self.themes[self.current_theme]["bg"]).pack(side=tk.LEFT)
         self.entry_tolerance = tk.Entry(row_tol, width=8)
         self.entry_tolerance.insert(0, "0")
-        self.entry_tolerance.pack(side=tk.LEFT, padx=(6,10))
-
-        btn_generate = tk.Button(row_tol, text="Gerar Relatório (Ctrl+G)", command=self.generate_report, bg="#2b7a78", fg="white")
-        btn_generate.pack(side=tk.LEFT, padx=5)
-        btn_export = tk.Button(row_tol, text="Exportar CSV (Ctrl+E)", command=self.export_report)
+        self.entry_tolerance.pack(side=tk.LEFT, padx=(6,4))
+        self.entry_tolerance.bind("<KeyRelease>", lambda e: self._preview_tolerance())
+        # Prévia ao vivo: com as cadeias prontas, contar as discrepâncias de uma tolerância é instantâneo
+        self.tol_scale = tk.Scale(row_tol, from_=0, to=100, orient=tk.HORIZONTAL, showvalue=False, length=120,
+                                  command=self._on_tolerance_scale, bg=self.themes[self.current_theme]["bg"], highlightthickness=0)
+        self.tol_scale.pack(side=tk.LEFT, padx=(0,10))
+
+        self.btn_generate = tk.Button(row_tol, text="Gerar Relatório (Ctrl+G)", command=self.generate_report, bg="#2b7a78", fg="white")
+        self.btn_generate.pack(side=tk.LEFT, padx=5)
+        self.btn_cancel = tk.Button(row_tol, text="Cancelar (Esc)", command=self.cancel_report, state='disabled')
+        self.btn_cancel.pack(side=tk.LEFT, padx=5)
+        btn_export = tk.Button(row_tol, text="Exportar (Ctrl+E)", command=self.export_report)
         btn_export.pack(side=tk.LEFT, padx=5)
+        # Histórico consulta a sessão gravada: só fica ativo enquanto há uma sessão pronta
+        self.btn_history = tk.Button(row_tol, text="Histórico (Ctrl+H)", command=self.open_history, state='disabled')
+        self.btn_history.pack(side=tk.LEFT, padx=5)
+        btn_open = tk.Button(row_tol, text="Abrir Sessão (Ctrl+O)", command=self.open_session)
+        btn_open.pack(side=tk.LEFT, padx=5)
+        btn_save = tk.Button(row_tol, text="Salvar Sessão (Ctrl+S)", command=self.save_session)
+        btn_save.pack(side=tk.LEFT, padx=5)
         btn_theme = tk.Button(row_tol, text="Alternar Tema (Ctrl+T)", command=self.toggle_theme)
         btn_theme.pack(side=tk.LEFT, padx=5)
+        self._backend_widgets += [self.btn_generate, btn_export, btn_open, btn_save, btn_theme]
+        tk.Button(row_tol, text="Diagnóstico (Ctrl+D)", command=self.open_diagnostics).pack(side=tk.LEFT, padx=5)
+        self.diag_var = tk.BooleanVar(value=False)
+        self.diag_memory_var = tk.BooleanVar(value=False)
+        self.diag_profile_var = tk.BooleanVar(value=False)
+        for w in self._backend_widgets: w.config(state='disabled')
 
+        self.status = tk.Label(self, text="Pronto", anchor='w', bg=self.themes[self.current_theme]["bg"])
+        self.status.pack(side=tk.BOTTOM, fill=tk.X)
+
+    def _build_report_area(self):
         # Center area: search + filters + resumo
-        center_ctrl = tk.Frame(top, bg=self.themes[self.current_theme]["bg"])
+        center_ctrl = tk.Frame(self._top, bg=self.themes[self.current_theme]["bg"])
         center_ctrl.pack(side=tk.LEFT, padx=20, anchor='n')
 
         search_row = tk.Frame(center_ctrl, bg=self.themes[self.current_theme]["bg"])
@@ -82,7 +199,7 @@ class StockValidatorApp(tk.Tk):
         self.search_var = tk.StringVar()
         self.entry_search = tk.Entry(search_row, textvariable=self.search_var, width=30)
         self.entry_search.pack(side=tk.LEFT, padx=(6,6))
-        self.entry_search.bind("<KeyRelease>", lambda e: self.apply_filters())
+        self.entry_search.bind("<KeyRelease>", lambda e: self._schedule_filters())
         tk.Label(search_row, text=" (produto / sugestão / tipo)", bg=self.themes[self.current_theme]["bg"], fg=self.themes[self.current_theme]["muted"]).pack(side=tk.LEFT)
 
         filter_row = tk.Frame(center_ctrl, bg=self.themes[self.current_theme]["bg"])
@@ -99,6 +216,8 @@ class StockValidatorApp(tk.Tk):
 
         self.summary_lbl = tk.Label(center_ctrl, text="Resumo: —", bg=self.themes[self.current_theme]["bg"])
         self.summary_lbl.pack(anchor='w', pady=(6,0))
+        self.preview_lbl = tk.Label(center_ctrl, text="", bg=self.themes[self.current_theme]["bg"], fg=self.themes[self.current_theme]["muted"])
+        self.preview_lbl.pack(anchor='w')
 
         # Right: Tree + detail
         right_frame = tk.Frame(self, bg=self.themes[self.current_theme]["bg"])
@@ -112,17 +231,26 @@ class StockValidatorApp(tk.Tk):
         for c in cols:
             self.tree.heading(c, text=c)
             self.tree.column(c, width=110, anchor="center")
-        vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self.tree.yview)
+        # Tabela virtual: a barra vertical percorre o DataFrame, não os itens do Treeview
+        self.vsb = ttk.Scrollbar(tree_frame, orient="vertical", command=self._on_vscroll)
         hsb = ttk.Scrollbar(tree_frame, orient="horizontal", command=self.tree.xview)
-        self.tree.configure(yscroll=vsb.set, xscroll=hsb.set)
+        self.tree.configure(xscroll=hsb.set)
         self.tree.grid(row=0, column=0, sticky='nsew')
-        vsb.grid(row=0, column=1, sticky='ns')
+        self.vsb.grid(row=0, column=1, sticky='ns')
         hsb.grid(row=1, column=0, sticky='ew')
         tree_frame.grid_rowconfigure(0, weight=1)
         tree_frame.grid_columnconfigure(0, weight=1)
 
         self.tree.bind("<<TreeviewSelect>>", self.on_select)
         self.tree.bind("<Double-1>", lambda e: self.open_full_suggestion())
+        self.tree.bind("<Configure>", lambda e: self._render_window())
+        self.tree.bind("<MouseWheel>", self._on_mousewheel)
+        self.tree.bind("<Button-4>", lambda e: self._scroll_rows(-3))
+        self.tree.bind("<Button-5>", lambda e: self._scroll_rows(3))
+        self.tree.bind("<Up>", lambda e: self._move_selection(-1))
+        self.tree.bind("<Down>", lambda e: self._move_selection(1))
+        self.tree.bind("<Prior>", lambda e: self._move_selection(-self._visible_rows()))
+        self.tree.bind("<Next>", lambda e: self._move_selection(self._visible_rows()))
 
         detail_frame = tk.Frame(right_frame, height=180, bg=self.themes[self.current_theme]["frame"])
         detail_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=2, pady=(8,0))
@@ -133,65 +261,286 @@ class StockValidatorApp(tk.Tk):
         self.sugg_box = ScrolledText(detail_frame, width=50, height=6, wrap='word', state='disabled')
         self.sugg_box.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=(6,6), pady=6)
 
-        self.status = tk.Label(self, text="Pronto", anchor='w', bg=self.themes[self.current_theme]["bg"])
-        self.status.pack(side=tk.BOTTOM, fill=tk.X)
+    # Loaders (abre CSV ou planilha e prepara a entrada agregada)
+    def _load_input(self, entry_widget, nome, label):
+        path = filedialog.askopenfilename(filetypes=[("CSV/Excel","*.csv *.xlsx *.xlsm"), ("CSV files","*.csv"), ("Excel files","*.xlsx *.xlsm")])
+        if path:
+            alvos = {nome: entry_widget}
+            if is_workbook(path):
+                # Planilha com uma aba por entrada: preenche também as entradas ainda vazias
+                for outro, entry in (('compras', self.entry_compras), ('vendas', self.entry_vendas), ('estoque', self.entry_estoque)):
+                    if getattr(self, f"{outro}_path") is None: alvos[outro] = entry
+            for n, entry in alvos.items():
+                entry.delete(0, tk.END); entry.insert(0, path)
+                setattr(self, f"{n}_path", path)
+            self._invalidate_prepared()
+            # Lê e agrega já na seleção, em segundo plano (abas de planilha em paralelo); o resultado fica no cache de entradas
+            self.status['text'] = f"Carregando {label}: {path.split('/')[-1]}..."
+            rejeitadas = {}
+            def loaded(_):
+                self.status['text'] = f"{', '.join(alvos)} carregado(s): {path.split('/')[-1]}"
+                if rejeitadas:
+                    messagebox.showwarning("Linhas ignoradas", "\n\n".join(format_errors(e, path) for e in rejeitadas.values()))
+            def failed(e):
+                for n in alvos:
+                    if getattr(self, f"{n}_path") == path: setattr(self, f"{n}_path", None)
+                self._invalidate_prepared()
+                messagebox.showerror("Erro", f"Não foi possível ler {label}: {e}")
+            cache = self.input_cache
+            self._submit(lambda: load_inputs({n: path for n in alvos}, cache=cache, errors=rejeitadas), loaded, failed)
 
-    # Loaders (abre CSV e atualiza DataFrame)
     def _load_compras_from_entry(self, entry_widget):
-        path = filedialog.askopenfilename(filetypes=[("CSV files","*.csv")])
-        if path:
-            entry_widget.delete(0, tk.END); entry_widget.insert(0, path)
-            try:
-                df = pd.read_csv(path); self.compras_df = df
-                self.status['text'] = f"Compras carregado: {path.split('/')[-1]}"
-            except Exception as e:
-                messagebox.showerror("Erro", f"Não foi possível ler Compras: {e}")
+        self._load_input(entry_widget, "compras", "Compras")
 
     def _load_vendas_from_entry(self, entry_widget):
-        path = filedialog.askopenfilename(filetypes=[("CSV files","*.csv")])
-        if path:
-            entry_widget.delete(0, tk.END); entry_widget.insert(0, path)
-            try:
-                df = pd.read_csv(path); self.vendas_df = df
-                self.status['text'] = f"Vendas carregado: {path.split('/')[-1]}"
-            except Exception as e:
-                messagebox.showerror("Erro", f"Não foi possível ler Vendas: {e}")
+        self._load_input(entry_widget, "vendas", "Vendas")
 
     def _load_estoque_from_entry(self, entry_widget):
-        path = filedialog.askopenfilename(filetypes=[("CSV files","*.csv")])
-        if path:
-            entry_widget.delete(0, tk.END); entry_widget.insert(0, path)
-            try:
-                df = pd.read_csv(path); self.estoque_df = df
-                self.status['text'] = f"Estoque carregado: {path.split('/')[-1]}"
-            except Exception as e:
-                messagebox.showerror("Erro", f"Não foi possível ler Estoque: {e}")
+        self._load_input(entry_widget, "estoque", "Estoque")
 
     # Geração do relatório (usa detect_discrepancies do módulo core)
     def generate_report(self, event=None):
+        if self._report_running: return
         try:
             tolerance = int(self.entry_tolerance.get())
         except Exception:
             messagebox.showerror("Erro", "Tolerância inválida. Insira um número inteiro.")
             return
 
-        if self.compras_df is None or self.vendas_df is None or self.estoque_df is None:
+        cancel = self._cancel_event.is_set
+        paths = (self.compras_path, self.vendas_path, self.estoque_path)
+        if not all(paths) and (self.compras_df is None or self.vendas_df is None or self.estoque_df is None):
             r = messagebox.askyesno("Dados ausentes", "Alguns arquivos não foram informados. Usar dados de exemplo?")
             if r:
                 self.compras_df, self.vendas_df, self.estoque_df = get_example_data()
+                self._invalidate_prepared()
             else:
-                messagebox.showerror("Erro", "Forneça os 3 arquivos CSV ou aceite usar os dados de exemplo.")
+                messagebox.showerror("Erro", "Forneça os 3 arquivos (CSV ou XLSX) ou aceite usar os dados de exemplo.")
                 return
 
+        key = self._inputs_key(paths)
+        prepared = self._prepared if key is not None and key == self._prepared_key else None
+        if all(paths):
+            meta = {'tolerancia': tolerance, 'compras': paths[0], 'vendas': paths[1], 'estoque': paths[2]}
+            # Arquivos em disco: agrega em blocos, reaproveitando o cache de entradas
+            cache = self.input_cache
+            def aggregate():
+                self._ui_queue.put(('status', "Carregando arquivos..."))
+                rejeitadas = {}
+                aggs = load_aggregated(*paths, cache=cache, cancel=cancel, errors=rejeitadas)
+                if rejeitadas:
+                    total = sum(len(e) for e in rejeitadas.values())
+                    self._ui_queue.put(('status', f"{total} linha(s) inválida(s) ignorada(s) ({', '.join(rejeitadas)}); reconciliando..."))
+                return aggs
+        else:
+            meta = {'tolerancia': tolerance}
+            compras, vendas, estoque = self.compras_df, self.vendas_df, self.estoque_df
+            def aggregate():
+                # Mesmo caminho de detect_discrepancies, mas guardando os agregados para a sessão
+                return aggregate_inputs(compras, vendas, estoque)
+
+        def task():
+            chains = prepared
+            if chains is None:
+                aggs = aggregate()
+                _check_cancel(cancel)
+                self._ui_queue.put(('status', "Montando cadeias de estoque..."))
+                chains = PreparedChains(*aggs, progress=self._report_progress, cancel=cancel)
+            report = chains.reconcile(tolerance, progress=self._report_progress, cancel=cancel)
+            return _indexed(report) + (chains, key, meta)
+        self._start_report(task)
+
+    def _inputs_key(self, paths):
+        """Identifica as entradas atuais: arquivos (caminho, mtime, tamanho) ou os frames em memória."""
+        if not all(paths):
+            return 'frames'
+        try:
+            return tuple((p, st.st_mtime_ns, st.st_size) for p, st in ((p, os.stat(p)) for p in paths))
+        except OSError:
+            return None
+
+    def _invalidate_prepared(self):
+        self._prepared = self._prepared_key = None
+        self.preview_lbl['text'] = ""
+
+    def _on_tolerance_scale(self, value):
+        self.entry_tolerance.delete(0, tk.END); self.entry_tolerance.insert(0, value)
+        self._preview_tolerance()
+
+    def _preview_tolerance(self):
+        """Contagem de discrepâncias para a tolerância digitada, sem gerar o relatório."""
+        if self._prepared is None: return
+        try: tolerance = int(self.entry_tolerance.get())
+        except ValueError: return
+        counts = {k: v for k, v in self._prepared.counts(tolerance).items() if v > 0}
+        partes = " | ".join(f"{k}: {v}" for k, v in counts.items())
+        self.preview_lbl['text'] = f"Prévia (tolerância {tolerance}): {sum(counts.values())} discrepância(s)" + (f" — {partes}" if partes else "")
+
+    # Execução em segundo plano: a thread de trabalho nunca toca nos widgets;
+    # resultados e progresso voltam pela fila, lida com after() na thread da UI.
+    QUEUE_POLL_MS = 100
+
+    def _submit(self, task, on_done, on_error, worker=None):
+        def run():
+            try: result = task()
+            except Exception as e: self._ui_queue.put(('call', on_error, e))
+            else: self._ui_queue.put(('call', on_done, result))
+        (worker or self._worker).submit(run)
+
+    def _poll_queue(self):
         try:
-            df = detect_discrepancies(self.compras_df, self.vendas_df, self.estoque_df, tolerance)
-        except Exception as e:
-            messagebox.showerror("Erro ao gerar relatório", str(e))
+            while True:
+                msg = self._ui_queue.get_nowait()
+                if msg[0] == 'status': self.status['text'] = msg[1]
+                else: msg[1](msg[2])
+        except queue.Empty:
+            pass
+        finally:
+            self.after(self.QUEUE_POLL_MS, self._poll_queue)
+
+    def _report_progress(self, done, total):
+        # Chamado na thread de trabalho
+        self._ui_queue.put(('status', f"Reconciliando: {done}/{total} produtos..."))
+
+    def _start_report(self, task):
+        self._cancel_event.clear(); self._report_running = True
+        self.btn_generate.config(state='disabled'); self.btn_cancel.config(state='normal')
+        self.status['text'] = "Gerando relatório..."
+        if self.diag_var.get():
+            # Mede carga e reconciliação (na thread de trabalho) e depois a exibição (em _on_report_done)
+            rec = self.recorder = perf.Recorder(memory=self.diag_memory_var.get(), profile=self.diag_profile_var.get())
+            def medido():
+                with rec: return task()
+            self._submit(medido, self._on_report_done, self._on_report_error)
             return
-        self.report_df = df.copy()
-        self._refresh_filters()
-        self._populate_tree(self.report_df)
-        self.status['text'] = f"Relatório gerado: {len(self.report_df)} discrepâncias encontradas."
+        self.recorder = None
+        self._submit(task, self._on_report_done, self._on_report_error)
+
+    def _finish_report(self):
+        self._report_running = False
+        self.btn_generate.config(state='normal'); self.btn_cancel.config(state='disabled')
+
+    def _on_report_done(self, result):
+        df, index, prepared, key, meta = result
+        self._finish_report()
+        self._prepared, self._prepared_key = prepared, key
+        # Acima da maior diferença nenhuma tolerância muda o resultado
+        tolerancia = int(meta['tolerancia'])
+        self.tol_scale.config(to=max(prepared.max_difference() + 1, tolerancia, 10)); self.tol_scale.set(tolerancia)
+        self._preview_tolerance()
+        aggs = prepared.aggs
+        if self.recorder is not None:
+            with self.recorder: self._show_report(df, index)
+            logger.info("Diagnóstico:\n" + self.recorder.format())
+            self._refresh_diagnostics()
+        else:
+            self._show_report(df, index)
+        # Grava a sessão em segundo plano (depois de exibir), para histórico e reabertura
+        anterior, self.store = self.store, None
+        self.btn_history.config(state='disabled')
+        def saved(store):
+            # Um relatório mais novo pode ter terminado antes desta gravação: fecha a sessão superada
+            superada, self.store = self.store, store
+            if superada is not None: self._submit(superada.close, lambda _: None, lambda e: None, self._session_worker)
+            self.btn_history.config(state='normal')
+        def failed(e):
+            logger.warning(f"Sessão não gravada: {e}")
+        report = self.report_df
+        def task():
+            # Na thread da sessão: tarefas já enfileiradas com a sessão anterior terminaram
+            if anterior is not None: anterior.close()
+            store = ReconciliationStore(DEFAULT_SESSION_PATH)
+            store.save(report, aggs, **meta)
+            return store
+        self._submit(task, saved, failed, self._session_worker)
+
+    def _on_report_error(self, e):
+        self._finish_report()
+        if isinstance(e, ReconciliationCancelled):
+            self.status['text'] = "Geração do relatório cancelada."; return
+        messagebox.showerror("Erro ao gerar relatório", str(e))
+
+    def cancel_report(self, event=None):
+        if not self._report_running: return
+        self._cancel_event.set(); self.status['text'] = "Cancelando..."
+
+    def _on_close(self):
+        self._cancel_event.set(); self._worker.shutdown(wait=False, cancel_futures=True)
+        self._session_worker.shutdown(wait=False, cancel_futures=True)
+        if self.store is not None: self.store.close()
+        self.destroy()
+
+    def _show_report(self, df, index, origem="Relatório gerado"):
+        # `df` e `index` vêm de `_indexed`, já montados na thread de trabalho
+        with perf.stage('show_report', rows_in=len(df)):
+            self.report_df = df
+            self.search_index = index
+            # iids são posições no relatório: a seleção do relatório anterior não vale neste
+            self._selected_iid = None
+            self._last_filter = None
+            with perf.stage('refresh_filters'):
+                self._refresh_filters()
+            self._populate_tree(self.report_df)
+        self.status['text'] = f"{origem}: {len(self.report_df)} discrepâncias encontradas."
+
+    # Sessões: relatório e movimentos ficam em um arquivo SQLite (ver store.py)
+    SESSION_FILETYPES = [("Sessão (SQLite)", "*.db"), ("Todos", "*.*")]
+
+    def open_session(self, event=None):
+        if self._report_running: return
+        path = filedialog.askopenfilename(filetypes=self.SESSION_FILETYPES)
+        if not path: return
+        def task():
+            store = ReconciliationStore(path)
+            try: return (store, *_indexed(store.report()), store.meta())
+            except Exception: store.close(); raise
+        def opened(result):
+            store, df, index, meta = result
+            anterior, self.store = self.store, store
+            if anterior is not None: self._submit(anterior.close, lambda _: None, lambda e: None, self._session_worker)
+            self.btn_history.config(state='normal')
+            if 'tolerancia' in meta:
+                self.entry_tolerance.delete(0, tk.END); self.entry_tolerance.insert(0, meta['tolerancia'])
+            self._show_report(df, index, f"Sessão {path.split('/')[-1]}")
+        self.status['text'] = f"Abrindo sessão: {path.split('/')[-1]}..."
+        self._submit(task, opened, lambda e: messagebox.showerror("Erro", f"Não foi possível abrir a sessão: {e}"),
+                     self._session_worker)
+
+    def save_session(self, event=None):
+        if self.store is None:
+            messagebox.showinfo("Salvar sessão", "Nenhuma sessão para salvar — gere um relatório primeiro."); return
+        path = filedialog.asksaveasfilename(defaultextension=".db", filetypes=self.SESSION_FILETYPES)
+        if not path: return
+        store = self.store
+        def saved(_):
+            self.status['text'] = f"Sessão salva: {path.split('/')[-1]}"
+        self._submit(lambda: store.backup(path), saved,
+                     lambda e: messagebox.showerror("Erro", f"Não foi possível salvar a sessão: {e}"), self._session_worker)
+
+    def open_history(self, event=None):
+        """Movimentos dia a dia do produto selecionado (consulta indexada na sessão)."""
+        # Pelo atalho também: sem sessão pronta (gravação pendente) não consulta a anterior
+        sel = self.tree.selection()
+        if not sel or self.store is None: return
+        produto = self.tree.item(sel[0], 'values')[0]
+        store = self.store
+        self._submit(lambda: store.history(produto), lambda df: self._show_history(produto, df),
+                     lambda e: messagebox.showerror("Erro", f"Não foi possível ler o histórico: {e}"), self._session_worker)
+
+    def _show_history(self, produto, df):
+        top = tk.Toplevel(self); top.title(f"Histórico — {produto}"); top.geometry("700x400")
+        cols = ("data", "compras", "vendas", "estoque", "tipo_discrepancia")
+        tree = ttk.Treeview(top, columns=cols, show="headings")
+        for c in cols:
+            tree.heading(c, text=c); tree.column(c, width=150 if c == "tipo_discrepancia" else 100, anchor="center")
+        vsb = ttk.Scrollbar(top, orient="vertical", command=tree.yview); tree.configure(yscroll=vsb.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=(8,0), pady=8); vsb.pack(side=tk.RIGHT, fill=tk.Y, pady=8)
+        for row in df.itertuples():
+            tipo = row.tipo_discrepancia if isinstance(row.tipo_discrepancia, str) else ''
+            tree.insert("", "end", values=(row.data.strftime('%Y-%m-%d'), _fmt_int(row.compras), _fmt_int(row.vendas), _fmt_int(row.estoque), tipo),
+                        tags=(self._tag_for_tipo(tipo),))
+        tree.tag_configure('tag_compra', foreground='#1b5e20'); tree.tag_configure('tag_venda', foreground='#b71c1c')
+        tree.tag_configure('tag_erro', foreground='#e65100'); tree.tag_configure('tag_info', foreground='#37474f')
 
     def _refresh_filters(self):
         prods = sorted(self.report_df['produto'].dropna().unique().tolist()) if not self.report_df.empty else []
@@ -204,19 +553,77 @@ class StockValidatorApp(tk.Tk):
     def _update_summary(self):
         if self.report_df.empty:
             self.summary_lbl['text'] = "Resumo: nenhum registro."; return
-        counts = self.report_df['tipo_discrepancia'].value_counts().to_dict()
+        counts = self.report_df['tipo_discrepancia'].value_counts()
+        counts = counts[counts > 0].to_dict()
         parts = [f"{k}: {v}" for k, v in counts.items()]
         self.summary_lbl['text'] = "Resumo: " + " | ".join(parts)
 
-    def _populate_tree(self, df):
+    # Tabela virtual: o relatório fica no DataFrame (view_df), as linhas exibidas
+    # são posições nele (view_pos) e só a janela visível, mais uma folga, é
+    # materializada como itens do Treeview.
+    VIRTUAL_BUFFER = 10
+
+    def _populate_tree(self, df, positions=None):
+        self.view_df = df
+        self.view_pos = np.arange(len(df)) if positions is None else positions
+        self._offset = 0
+        with perf.stage('populate_tree', rows_in=len(self.view_pos)):
+            self._render_window()
+        self._style_tree_tags()
+        with perf.stage('autosize_columns'):
+            self._autosize_columns()
+
+    def _visible_rows(self):
+        row_h = int(self.style.lookup("Treeview", "rowheight") or 20)
+        return max(1, self.tree.winfo_height() // row_h - 1)
+
+    def _row_values(self, row):
+        sug = _sugestao_texto(row)
+        sug_preview = (sug[:80] + '...') if len(sug) > 80 else sug
+        return (row.produto, row.data.strftime('%Y-%m-%d'), _fmt_int(row.estoque_anterior), _fmt_int(row.compras), _fmt_int(row.vendas),
+                _fmt_int(row.estoque_atual), _fmt_int(row.estoque_esperado), _fmt_int(row.diferenca), row.tipo_discrepancia, sug_preview)
+
+    def _render_window(self):
         for r in self.tree.get_children(): self.tree.delete(r)
-        if df.empty: return
-        for idx, row in df.iterrows():
-            sug_preview = (row.sugestao[:80] + '...') if row.sugestao and len(row.sugestao) > 80 else (row.sugestao or '')
-            vals = (row.produto, row.data.strftime('%Y-%m-%d'), row.estoque_anterior, row.compras, row.vendas, row.estoque_atual, row.estoque_esperado, row.diferenca, row.tipo_discrepancia, sug_preview)
-            tag = self._tag_for_tipo(str(row.tipo_discrepancia))
-            self.tree.insert("", "end", iid=str(idx), values=vals, tags=(tag,))
-        self._style_tree_tags(); self._autosize_columns()
+        n = len(self.view_pos); visible = self._visible_rows()
+        self._offset = max(0, min(self._offset, n - visible))
+        for row in self.view_df.iloc[self.view_pos[self._offset:self._offset + visible + self.VIRTUAL_BUFFER]].itertuples():
+            self.tree.insert("", "end", iid=str(row.Index), values=self._row_values(row), tags=(self._tag_for_tipo(str(row.tipo_discrepancia)),))
+        if self._selected_iid and self.tree.exists(self._selected_iid):
+            self.tree.selection_set(self._selected_iid)
+        if n: self.vsb.set(self._offset / n, min(1.0, (self._offset + visible) / n))
+        else: self.vsb.set(0, 1)
+
+    def _on_vscroll(self, *args):
+        n = len(self.view_pos); visible = self._visible_rows()
+        if args[0] == 'moveto':
+            self._offset = int(float(args[1]) * n)
+        elif args[0] == 'scroll':
+            self._offset += int(args[1]) * (visible if args[2] == 'pages' else 1)
+        self._render_window()
+
+    def _scroll_rows(self, delta):
+        self._offset += delta; self._render_window()
+        return "break"
+
+    def _on_mousewheel(self, event):
+        return self._scroll_rows(-3 if event.delta > 0 else 3)
+
+    def _move_selection(self, delta):
+        n = len(self.view_pos)
+        if not n: return "break"
+        pos = self._offset - 1
+        if self._selected_iid:
+            alvo = self.view_df.index.get_indexer([int(self._selected_iid)])[0]
+            i = np.searchsorted(self.view_pos, alvo)
+            if i < n and self.view_pos[i] == alvo: pos = i
+        new = max(0, min(n - 1, pos + delta))
+        visible = self._visible_rows()
+        if new < self._offset: self._offset = new
+        elif new >= self._offset + visible: self._offset = new - visible + 1
+        self._selected_iid = str(self.view_df.index[self.view_pos[new]])
+        self._render_window(); self.tree.focus(self._selected_iid)
+        return "break"
 
     def _tag_for_tipo(self, tipo):
         if tipo == 'falta_registro_compra': return 'tag_compra'
@@ -233,83 +640,122 @@ class StockValidatorApp(tk.Tk):
         self.tree.tag_configure('tag_info', foreground='#37474f')
         self.tree.tag_configure('tag_default', foreground=theme['muted'])
 
-    def _autosize_columns(self):
-        for col in self.tree['columns']:
-            max_len = len(col)
-            for iid in self.tree.get_children():
-                val = str(self.tree.set(iid, col))
-                if len(val) > max_len: max_len = len(val)
+    def _autosize_columns(self, sample_size=2000):
+        # Larguras estimadas a partir de uma amostra do relatório, não de cada célula
+        pos = self.view_pos
+        if len(pos) > sample_size: pos = np.sort(np.random.default_rng(0).choice(pos, sample_size, replace=False))
+        amostra = self.view_df.iloc[pos]
+        valores = [self._row_values(r) for r in amostra.itertuples()]
+        for i, col in enumerate(self.tree['columns']):
+            max_len = max([len(col)] + [len(str(v[i])) for v in valores])
             width = min(max(80, max_len * 8 + 20), 500)
             self.tree.column(col, width=width)
 
+    def _selected_row(self, iid):
+        """Linha do relatório de um item do Treeview (o iid é a posição em `report_df`)."""
+        return self.report_df.iloc[int(iid)]
+
     def on_select(self, event):
         sel = self.tree.selection()
         if not sel: return
-        iid = sel[0]
-        try:
-            row = self.report_df.iloc[int(iid)]
-        except Exception:
-            vals = self.tree.item(iid, 'values')
-            produto, data = vals[0], vals[1]
-            mask = (self.report_df['produto'] == produto) & (self.report_df['data'].dt.strftime('%Y-%m-%d') == data)
-            if not mask.any(): return
-            row = self.report_df.loc[mask].iloc[0]
+        iid = sel[0]; self._selected_iid = iid
+        row = self._selected_row(iid)
 
         details = (
             f"Produto: {row.produto}\n"
             f"Data: {row.data.strftime('%Y-%m-%d')}\n"
-            f"Estoque anterior: {row.estoque_anterior}\n"
+            f"Estoque anterior: {_fmt_int(row.estoque_anterior)}\n"
             f"Compras: {row.compras}\n"
             f"Vendas: {row.vendas}\n"
-            f"Estoque atual: {row.estoque_atual}\n"
-            f"Estoque esperado: {row.estoque_esperado}\n"
-            f"Diferença: {row.diferenca}\n"
+            f"Estoque atual: {_fmt_int(row.estoque_atual)}\n"
+            f"Estoque esperado: {_fmt_int(row.estoque_esperado)}\n"
+            f"Diferença: {_fmt_int(row.diferenca)}\n"
             f"Tipo: {row.tipo_discrepancia}\n"
         )
         self.detail_text.config(state='normal'); self.detail_text.delete('1.0', tk.END); self.detail_text.insert(tk.END, details); self.detail_text.config(state='disabled')
-        self.sugg_box.config(state='normal'); self.sugg_box.delete('1.0', tk.END); self.sugg_box.insert(tk.END, row.sugestao or ""); self.sugg_box.config(state='disabled')
+        self.sugg_box.config(state='normal'); self.sugg_box.delete('1.0', tk.END); self.sugg_box.insert(tk.END, _sugestao_texto(row)); self.sugg_box.config(state='disabled')
 
     def open_full_suggestion(self):
         sel = self.tree.selection()
         if not sel: return
-        iid = sel[0]
-        try:
-            row = self.report_df.iloc[int(iid)]
-        except Exception:
-            vals = self.tree.item(iid, 'values'); produto, data = vals[0], vals[1]
-            mask = (self.report_df['produto'] == produto) & (self.report_df['data'].dt.strftime('%Y-%m-%d') == data)
-            row = self.report_df.loc[mask].iloc[0]
+        row = self._selected_row(sel[0])
         top = tk.Toplevel(self); top.title("Sugestão completa"); top.geometry("600x300")
         txt = ScrolledText(top, wrap='word'); txt.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
-        txt.insert(tk.END, row.sugestao or ""); txt.config(state='disabled')
+        txt.insert(tk.END, _sugestao_texto(row)); txt.config(state='disabled')
+
+    # Busca rápida: aplicada só depois de uma pausa na digitação; buscas pendentes são canceladas
+    SEARCH_DEBOUNCE_MS = 150
+
+    def _schedule_filters(self):
+        if self._filter_job is not None: self.after_cancel(self._filter_job)
+        self._filter_job = self.after(self.SEARCH_DEBOUNCE_MS, self.apply_filters)
 
     def apply_filters(self):
-        if self.report_df.empty: return
-        df = self.report_df.copy()
-        q = self.search_var.get().strip().lower()
+        self._filter_job = None
+        if self.report_df.empty or self.search_index is None: return
+        q = self.search_var.get()
         prod = self.produto_filter.get(); tipo = self.tipo_filter.get()
-        if prod and prod != "(todos)": df = df[df['produto'] == prod]
-        if tipo and tipo != "(todos)": df = df[df['tipo_discrepancia'] == tipo]
-        if q:
-            mask = df.apply(lambda r: q in str(r['produto']).lower() or q in str(r['sugestao']).lower() or q in str(r['tipo_discrepancia']).lower(), axis=1)
-            df = df[mask]
-        self._populate_tree(df)
+        filtro = (q.strip().lower(), prod, tipo)
+        if filtro == self._last_filter: return
+        self._last_filter = filtro
+        positions = self.search_index.positions(q, prod if prod and prod != "(todos)" else None, tipo if tipo and tipo != "(todos)" else None)
+        self._populate_tree(self.report_df, positions)
+
+    EXPORT_FILETYPES = [("CSV files","*.csv"), ("CSV gzip","*.csv.gz"), ("Parquet","*.parquet")]
 
     def export_report(self, event=None):
         if self.report_df.empty:
             messagebox.showinfo("Exportar", "Relatório vazio — nada a exportar."); return
-        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files","*.csv")])
+        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=self.EXPORT_FILETYPES)
         if not path: return
-        rows = []
-        for iid in self.tree.get_children():
-            vals = self.tree.item(iid, 'values')
-            rows.append({'produto': vals[0],'data': vals[1],'estoque_anterior': vals[2],'compras': vals[3],'vendas': vals[4],'estoque_atual': vals[5],'estoque_esperado': vals[6],'diferenca': vals[7],'tipo_discrepancia': vals[8],'sugestao_preview': vals[9]})
-        try:
-            pd.DataFrame(rows).to_csv(path, index=False)
-            self.status['text'] = f"Exportado: {path.split('/')[-1]}"
+        # Exporta direto do DataFrame as linhas filtradas (view_pos), com todas as colunas e a sugestão completa
+        report, rows = self.view_df, self.view_pos
+        def progress(feitas, total):
+            self._ui_queue.put(('status', f"Exportando: {feitas}/{total} linhas..."))
+        def done(n):
+            self.status['text'] = f"Exportado: {path.split('/')[-1]} ({n} linhas)"
             messagebox.showinfo("Exportado", f"Arquivo salvo em:\n{path}")
-        except Exception as e:
-            messagebox.showerror("Erro exportar", str(e))
+        self.status['text'] = f"Exportando {len(rows)} linhas..."
+        self._submit(lambda: export_report(report, path, rows, progress=progress), done,
+                     lambda e: messagebox.showerror("Erro exportar", str(e)))
+
+    # Painel de diagnóstico: liga a instrumentação (perf) e mostra as métricas da última geração
+    def open_diagnostics(self, event=None):
+        if self.diag_window is not None and self.diag_window.winfo_exists():
+            self.diag_window.lift(); return
+        top = self.diag_window = tk.Toplevel(self); top.title("Diagnóstico de desempenho"); top.geometry("900x450")
+        opts = tk.Frame(top); opts.pack(fill=tk.X, padx=8, pady=(8,0))
+        tk.Checkbutton(opts, text="Medir próxima geração", variable=self.diag_var).pack(side=tk.LEFT)
+        tk.Checkbutton(opts, text="Pico de memória (tracemalloc, mais lento)", variable=self.diag_memory_var).pack(side=tk.LEFT, padx=6)
+        tk.Checkbutton(opts, text="Perfil cProfile", variable=self.diag_profile_var).pack(side=tk.LEFT, padx=6)
+        tk.Button(opts, text="Salvar JSON", command=self.save_metrics).pack(side=tk.RIGHT)
+        tk.Button(opts, text="Salvar perfil (.prof)", command=self.save_profile).pack(side=tk.RIGHT, padx=6)
+        self.diag_text = ScrolledText(top, wrap='none', font=('Courier', 9)); self.diag_text.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        self._refresh_diagnostics()
+
+    def _refresh_diagnostics(self):
+        if self.diag_window is None or not self.diag_window.winfo_exists(): return
+        if self.recorder is None:
+            texto = "Sem métricas. Marque \"Medir próxima geração\" e gere o relatório."
+        else:
+            texto = self.recorder.format() + f"\n\nPico de RSS do processo: {perf._rss_max_mb()} MB"
+            perfil = self.recorder.profile_stats(20)
+            if perfil:
+                texto += "\n\nFunções por tempo acumulado (cProfile):\n" + "\n".join(
+                    f"{p['cumtime']:9.3f}s {p['tottime']:9.3f}s {p['calls']:>8}  {p['function']}" for p in perfil)
+        self.diag_text.config(state='normal'); self.diag_text.delete('1.0', tk.END); self.diag_text.insert(tk.END, texto); self.diag_text.config(state='disabled')
+
+    def save_metrics(self):
+        if self.recorder is None:
+            messagebox.showinfo("Diagnóstico", "Nenhuma métrica coletada ainda."); return
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON","*.json")])
+        if path: self.recorder.to_json(path)
+
+    def save_profile(self):
+        if self.recorder is None or self.recorder.profiler is None:
+            messagebox.showinfo("Diagnóstico", "Nenhum perfil capturado (marque \"Perfil cProfile\" antes de gerar)."); return
+        path = filedialog.asksaveasfilename(defaultextension=".prof", filetypes=[("cProfile","*.prof")])
+        if path: self.recorder.dump_profile(path)
 
     def toggle_theme(self, event=None):
         self.current_theme = "dark" if self.current_theme == "light" else "light"; self.apply_theme()
@@ -332,3 +778,8 @@ class StockValidatorApp(tk.Tk):
         self.bind_all("<Control-e>", self.export_report); self.bind_all("<Control-E>", self.export_report)
         self.bind_all("<Control-f>", lambda e: self.entry_search.focus_set()); self.bind_all("<Control-F>", lambda e: self.entry_search.focus_set())
         self.bind_all("<Control-t>", lambda e: self.toggle_theme()); self.bind_all("<Control-T>", lambda e: self.toggle_theme())
+        self.bind_all("<Control-h>", self.open_history); self.bind_all("<Control-H>", self.open_history)
+        self.bind_all("<Control-o>", self.open_session); self.bind_all("<Control-O>", self.open_session)
+        self.bind_all("<Control-s>", self.save_session); self.bind_all("<Control-S>", self.save_session)
+        self.bind_all("<Control-d>", self.open_diagnostics); self.bind_all("<Control-D>", self.open_diagnostics)
+        self.bind_all("<Escape>", self.cancel_report)
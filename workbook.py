@@ -0,0 +1,172 @@
+# workbook.py
+"""
+Leitura de planilhas Excel (.xlsx) com uma aba por entrada (compras, vendas, estoque).
+
+O XML de cada aba é lido em streaming direto do arquivo .xlsx (zip), sem
+montar a planilha em memória: só as células das colunas data/produto/
+quantidade são guardadas, como texto, e convertidas depois pelo mesmo
+caminho tipado dos CSVs (`loaders.normalize_frame`), com as mesmas linhas
+rejeitadas. Abas diferentes são processadas em paralelo, uma por processo.
+"""
+import os
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import logging
+from core import DEFAULT_KEYS
+from loaders import DATE_FORMAT, LoadResult, normalize_frame
+
+logger = logging.getLogger("workbook")
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+
+# Aba de cada entrada (o nome é comparado sem diferenciar maiúsculas)
+SHEETS = {
+    'compras': 'compras',
+    'vendas': 'vendas',
+    'estoque': 'estoque',
+}
+
+_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+def is_workbook(path):
+    return str(path).lower().endswith(EXCEL_EXTENSIONS)
+
+def _sheet_members(z):
+    """Nome da aba -> arquivo XML dentro do zip, e se a planilha usa o calendário de 1904."""
+    wb = ET.fromstring(z.read('xl/workbook.xml'))
+    rels = ET.fromstring(z.read('xl/_rels/workbook.xml.rels'))
+    targets = {r.get('Id'): r.get('Target') for r in rels.iter(_PKG_REL_NS + 'Relationship')}
+    members = {}
+    for s in wb.iter(_NS + 'sheet'):
+        target = targets[s.get(_REL_NS + 'id')]
+        members[s.get('name')] = target.lstrip('/') if target.startswith('/') else posixpath.normpath('xl/' + target)
+    pr = wb.find(_NS + 'workbookPr')
+    date1904 = pr is not None and pr.get('date1904') in ('1', 'true')
+    return members, date1904
+
+def _shared_strings(z):
+    if 'xl/sharedStrings.xml' not in z.namelist():
+        return []
+    strings = []
+    with z.open('xl/sharedStrings.xml') as fh:
+        for _, el in ET.iterparse(fh):
+            if el.tag == _NS + 'si':
+                strings.append(''.join(t.text or '' for t in el.iter(_NS + 't')))
+                el.clear()
+    return strings
+
+def _read_cells(fh, cols, shared):
+    """
+    Percorre o XML de uma aba e devolve ({coluna: lista de textos} para `cols`,
+    número de cada linha na planilha).
+
+    A primeira linha é o cabeçalho; as demais colunas nem são convertidas.
+    Células vazias viram None.
+    """
+    C, V, IS, ROW = _NS + 'c', _NS + 'v', _NS + 'is', _NS + 'row'
+    letras = None                      # letra da coluna -> nome, após ler o cabeçalho
+    valores = {c: [] for c in cols}
+    numeros = []
+    linha = {}
+    n = 0
+    for _, el in ET.iterparse(fh):
+        tag = el.tag
+        if tag == C:
+            letra = el.get('r', '').rstrip('0123456789')
+            if letras is None or letra in letras:
+                tipo = el.get('t')
+                if tipo == 'inlineStr':
+                    node = el.find(IS)
+                    texto = ''.join(node.itertext()) if node is not None else None
+                else:
+                    node = el.find(V)
+                    texto = node.text if node is not None else None
+                    if tipo == 's' and texto is not None:
+                        texto = shared[int(texto)]
+                    elif tipo == 'e':
+                        texto = None
+                linha[letra] = texto
+            el.clear()
+        elif tag == ROW:
+            n = int(el.get('r') or n + 1)
+            if letras is None:
+                letras = {l: str(t).strip() for l, t in linha.items() if t is not None and str(t).strip() in cols}
+            else:
+                for letra, nome in letras.items():
+                    valores[nome].append(linha.get(letra))
+                numeros.append(n)
+            linha = {}
+            el.clear()
+    achadas = set((letras or {}).values())
+    return {c: v for c, v in valores.items() if c in achadas}, numeros
+
+def _serial_dates(texto, date1904):
+    """
+    Datas do Excel: números seriais (células formatadas como data) viram
+    Timestamp; textos ficam como estão, para a conversão de `loaders.parse_dates`.
+    """
+    serial = pd.to_numeric(texto, errors='coerce')
+    numericas = serial.notna()
+    if not numericas.any():
+        return texto
+    origem = '1904-01-01' if date1904 else '1899-12-30'
+    datas = texto.astype(object)
+    datas[numericas] = pd.to_datetime(serial[numericas], unit='D', origin=origem).astype('datetime64[us]')
+    return datas
+
+def read_sheet(path, sheet, qty_col, keys=DEFAULT_KEYS, date_format=DATE_FORMAT):
+    """
+    Lê data/`keys`/`qty_col` de uma aba; devolve `loaders.LoadResult` (frame
+    tipado como o dos CSVs e linhas rejeitadas, numeradas como na planilha).
+    """
+    cols = ['data', *keys, qty_col]
+    with zipfile.ZipFile(path) as z:
+        members, date1904 = _sheet_members(z)
+        nome = next((n for n in members if n.strip().lower() == sheet.lower()), None)
+        if nome is None:
+            raise ValueError(f"Aba '{sheet}' não encontrada em {os.path.basename(path)} (abas: {', '.join(members)})")
+        shared = _shared_strings(z)
+        with z.open(members[nome]) as fh:
+            valores, numeros = _read_cells(fh, cols, shared)
+    if 'data' not in valores:
+        raise ValueError(f"Aba '{nome}': coluna 'data' não encontrada")
+    df = pd.DataFrame({c: pd.Series(v, dtype=object) for c, v in valores.items()})
+    linhas = np.asarray(numeros, dtype=np.int64)
+    cheias = df.notna().any(axis=1).to_numpy()
+    df, linhas = df[cheias].reset_index(drop=True), linhas[cheias]
+    df['data'] = _serial_dates(df['data'], date1904)
+    lido = normalize_frame(df, qty_col, date_format, first_line=0, keys=keys)
+    if len(lido.errors):
+        # `first_line=0`: a linha do erro é a posição no frame; traduz para a linha da planilha
+        lido.errors['linha'] = linhas[lido.errors['linha'].to_numpy()]
+    logger.info(f"{os.path.basename(path)} [{nome}]: {len(lido.frame)} linhas")
+    return lido
+
+def read_sheet_aggregated(path, sheet, qty_col, keys=DEFAULT_KEYS, date_format=DATE_FORMAT):
+    """Como `read_sheet`, mas com `qty_col` já somada por chave/dia no frame."""
+    lido = read_sheet(path, sheet, qty_col, keys, date_format)
+    agg = lido.frame.groupby([*keys, 'data'], as_index=False, observed=True)[qty_col].sum()
+    return LoadResult(agg, lido.errors)
+
+def read_sheets(jobs, workers=None, aggregated=False):
+    """
+    Lê várias abas em paralelo.
+
+    `jobs` mapeia um nome para (caminho, aba, coluna de quantidade[, chaves[,
+    formato de data]]); devolve um dict com os mesmos nomes -> `LoadResult`.
+    Cada aba é lida em um processo separado (até `workers`, padrão: uma por
+    aba limitada ao número de CPUs).
+    """
+    reader = read_sheet_aggregated if aggregated else read_sheet
+    workers = min(len(jobs), workers or os.cpu_count() or 1)
+    if workers <= 1:
+        return {nome: reader(*job) for nome, job in jobs.items()}
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futures = {nome: ex.submit(reader, *job) for nome, job in jobs.items()}
+        return {nome: f.result() for nome, f in futures.items()}